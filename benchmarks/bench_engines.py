@@ -0,0 +1,63 @@
+"""
+Compares csv parse time and dataframe memory across engines ('c' and
+'pyarrow', see chart_tools.data.parsing). Files are parsed from bytes
+already in memory, so only parsing is timed, not the download.
+With no arguments, uses synthetic csvs: a wide numeric one, and a mixed
+one with strings. Otherwise, pass paths to local csv files (the sample
+datasets saved with Source.save_all, for instance).
+
+    python benchmarks/bench_engines.py [file.csv ...]
+"""
+import io
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from chart_tools.data.parsing import ENGINES, has_pyarrow, read_kwargs
+
+
+def synthetic(seed=0) -> dict:
+    """ {name: csv bytes} """
+    rng = np.random.default_rng(seed)
+    wide = pd.DataFrame(rng.normal(size=(200_000, 100)), columns=[f"x{i}" for i in range(100)])
+    mixed = pd.DataFrame({
+        'id': np.arange(500_000),
+        'value': rng.normal(size=500_000),
+        'count': rng.integers(0, 1000, size=500_000),
+        'label': rng.choice([f"label_{i}" for i in range(50)], size=500_000),
+        })
+    return {name: df.to_csv(index=False).encode() for name, df in (('wide', wide), ('mixed', mixed))}
+
+
+def time_parse(data:bytes, engine, repeat=3) -> tuple:
+    """ (best seconds, df memory in bytes) """
+    best, df = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = pd.read_csv(io.BytesIO(data), **read_kwargs(engine))
+        best = min(best, time.perf_counter() - start)
+    return best, int(df.memory_usage(deep=True).sum())
+
+
+def main(paths):
+    if paths:
+        files = {os.path.basename(p): open(p, "rb").read() for p in paths}
+    else:
+        files = synthetic()
+    engines = [e for e in ENGINES if e != 'pyarrow' or has_pyarrow()]
+
+    print(f"cpus: {os.cpu_count()}")
+    print(f"{'file':>20} {'MB':>8} {'engine':>8} {'parse (s)':>10} {'df MB':>8} {'speedup':>8}")
+    for name, data in files.items():
+        base = None
+        for engine in engines:
+            t, nbytes = time_parse(data, engine)
+            base = base or t
+            print(f"{name[-20:]:>20} {len(data) / 1024**2:>8.1f} {engine:>8} "
+                  f"{t:>10.3f} {nbytes / 1024**2:>8.1f} {base / t:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
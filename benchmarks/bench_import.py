@@ -0,0 +1,48 @@
+"""
+Times 'import chart_tools' in a fresh interpreter, and checks that it
+stays cheap: no network connections, no pandas/matplotlib/seaborn.
+Exits non-zero if any check fails.
+
+    python benchmarks/bench_import.py [budget_ms]
+"""
+import sys
+import json
+import subprocess
+
+CHILD = """
+import socket, sys, time, json
+connections = []
+def connect(self, address):
+    connections.append(str(address))
+    raise OSError("network disabled")
+socket.socket.connect = connect
+
+start = time.perf_counter()
+import chart_tools
+elapsed = time.perf_counter() - start
+
+heavy = [m for m in ('pandas', 'matplotlib', 'seaborn', 'requests') if m in sys.modules]
+print(json.dumps({'ms': elapsed * 1000, 'connections': connections, 'heavy': heavy}))
+"""
+
+
+def measure(repeat=5) -> dict:
+    """ Best of repeat runs, each in a new interpreter """
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return min(runs, key=lambda r: r['ms'])
+
+
+def main(budget_ms=50):
+    res = measure()
+    print(f"import chart_tools: {res['ms']:.1f} ms (budget {budget_ms} ms)")
+    print(f"network connections: {len(res['connections'])}")
+    print(f"heavy modules imported: {res['heavy'] or 'none'}")
+    ok = res['ms'] <= budget_ms and not res['connections'] and not res['heavy']
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(*[float(a) for a in sys.argv[1:]]))
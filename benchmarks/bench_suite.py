@@ -0,0 +1,211 @@
+"""
+Offline benchmark suite for data loading, caching and superheat.
+Serves a synthetic repository from a local fake Github (fakegithub.py),
+so results don't depend on the network. Measures:
+    - import chart_tools
+    - Library construction, and prefetching all its sources
+    - Source.load, cold (nothing cached) and warm (memory cache hit)
+    - DFCache.get, in 'lazy', 'view' and 'copy' modes
+    - save_all, fresh and resumed (everything up to date)
+    - superheat data preparation and rendering, 10 to 2000 variables
+Results are written as json. Every timing is in seconds, lower is
+better. With --baseline, timings that got slower than the baseline by
+more than --tolerance are reported, and the exit code is 1.
+
+    python benchmarks/bench_suite.py [--quick] [--out results.json]
+                                     [--baseline old.json] [--tolerance 0.25]
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from chart_tools.data import web, treecache
+from chart_tools.data.dfcache import DFCache, set_cache_copy_mode
+from chart_tools.data.source import Source
+from chart_tools.data.library import Library
+from chart_tools.heatmaps.superheat import clear_prepared_cache
+
+from fakegithub import FakeGithub, USER, REPO, BRANCH
+import bench_import
+import bench_superheat
+
+
+def best(fn, repeat=3) -> float:
+    """ Fastest of repeat calls to fn, in seconds """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def cold():
+    """ Forget everything cached in memory: dfs and remembered responses """
+    DFCache().clear()
+    web._etags.clear()
+
+
+def bench_library(fake, n_sources) -> dict:
+    url = fake.library_url(n_sources)
+    def construct():
+        cold()
+        return Library(url)
+    def prefetch():
+        Library(url).prefetch()
+    return {
+        'seconds': best(construct),
+        'prefetch_seconds': best(prefetch),
+        'sources': n_sources,
+    }
+
+
+def bench_load(fake) -> dict:
+    source = Source(USER, REPO, BRANCH, "")
+    source.refresh_datasets(force=True)
+    names = source.datasets
+    nbytes = sum(len(data) for data in fake.files.values())
+
+    def load_all():
+        for name in names:
+            source.load(name)
+
+    cold()
+    start = time.perf_counter()
+    load_all()
+    cold_seconds = time.perf_counter() - start
+    return {
+        'cold_seconds': cold_seconds,
+        'warm_seconds': best(load_all),
+        'files': len(names),
+        'mb': nbytes / 1024**2,
+        'cold_mb_per_second': nbytes / 1024**2 / cold_seconds,
+    }
+
+
+def bench_cache_hit(fake, repeat=200) -> dict:
+    source = Source(USER, REPO, BRANCH, "")
+    name = source.datasets[0]
+    source.load(name)
+    results = {}
+    for mode in ('lazy', 'view', 'copy'):
+        set_cache_copy_mode(mode)
+        results[f"{mode}_seconds"] = best(lambda: [source.cache.get(name) for _ in range(repeat)]) / repeat
+    set_cache_copy_mode('lazy')
+    return results
+
+
+def bench_save_all(fake) -> dict:
+    source = Source(USER, REPO, BRANCH, "")
+    nbytes = sum(len(data) for data in fake.files.values())
+    with tempfile.TemporaryDirectory() as dir:
+        start = time.perf_counter()
+        source.save_all(dir, progress=False)
+        fresh = time.perf_counter() - start
+        resumed = best(lambda: source.save_all(dir, progress=False))
+    return {
+        'seconds': fresh,
+        'resumed_seconds': resumed,
+        'mb_per_second': nbytes / 1024**2 / fresh,
+    }
+
+
+def bench_superheat_sizes(sizes) -> dict:
+    results = {}
+    for n in sizes:
+        corr = bench_superheat.random_corr(n)
+        clear_prepared_cache()
+        prep = bench_superheat.time_prepare(corr, repeat=1, thresh_avg=0.001, thresh_mask=0.05)
+        render = bench_superheat.time_render(corr)
+        results[str(n)] = {'prepare_seconds': prep, 'render_seconds': render}
+        plt.close('all')
+    return results
+
+
+def run(quick=False) -> dict:
+    shape = dict(n_files=10, rows=2_000, cols=10) if quick else dict(n_files=40, rows=20_000, cols=20)
+    sizes = [10, 100, 500] if quick else [10, 50, 100, 300, 500, 1000, 2000]
+
+    fake = FakeGithub(depth=2, **shape).start()
+    web.set_base_urls(fake.api_url, fake.raw_url)
+    treecache.set_tree_cache(None)
+    try:
+        results = {
+            'import': {'seconds': bench_import.measure()['ms'] / 1000},
+            'library': bench_library(fake, 5 if quick else 20),
+            'load': bench_load(fake),
+            'cache_hit': bench_cache_hit(fake),
+            'save_all': bench_save_all(fake),
+            'superheat': bench_superheat_sizes(sizes),
+        }
+    finally:
+        fake.stop()
+
+    return {
+        'meta': {
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'cpus': os.cpu_count(),
+            'quick': quick,
+            'repo': shape,
+        },
+        'results': results,
+    }
+
+
+def flatten(results, prefix="") -> dict:
+    """ {'load.cold_seconds': 1.2, ...} for every timing """
+    flat = {}
+    for k, v in results.items():
+        if isinstance(v, dict):
+            flat.update(flatten(v, f"{prefix}{k}."))
+        elif k.endswith("seconds"):
+            flat[f"{prefix}{k}"] = v
+    return flat
+
+
+def compare(results, baseline, tolerance) -> list:
+    """ (name, baseline, now) for each timing that regressed """
+    old, new = flatten(baseline['results']), flatten(results['results'])
+    return [
+        (k, old[k], new[k]) for k in sorted(new)
+        if k in old and new[k] > old[k] * (1 + tolerance)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--quick", action="store_true", help="small repo and matrix sizes")
+    parser.add_argument("--out", default="-", help="json output file, or - for stdout")
+    parser.add_argument("--baseline", help="json results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, as a fraction")
+    args = parser.parse_args()
+
+    results = run(args.quick)
+    text = json.dumps(results, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.4f}s -> {new:.4f}s ({new / old - 1:+.0%})", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
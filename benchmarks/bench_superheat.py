@@ -0,0 +1,69 @@
+"""
+Times the data stage of superheat() (masking, melting, colour lookup)
+across matrix sizes, so we can see how it scales with the number of variables.
+Then times a full render + savefig, with and without drop_zeros, and
+with the image backend.
+
+    python benchmarks/bench_superheat.py [n_vars ...]
+"""
+import io
+import sys
+import time
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from chart_tools.heatmaps.superheat import superheat, prepare_corr, value_to_color
+
+
+def random_corr(n_vars, n_rows=500, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+            rng.normal(size=(n_rows, n_vars)),
+            columns=[f"var_{i}" for i in range(n_vars)],
+            )
+    return df.corr()
+
+
+def time_prepare(corr, repeat=3, **kwargs) -> float:
+    palette = sns.diverging_palette(20, 220, n=128)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = prepare_corr(corr, **kwargs)
+        value_to_color(data.value, palette)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_render(corr, fmt='png', **kwargs) -> float:
+    start = time.perf_counter()
+    fig, ax = superheat(corr, **kwargs)
+    fig.savefig(io.BytesIO(), format=fmt)
+    plt.close(fig)
+    return time.perf_counter() - start
+
+
+def main(sizes):
+    print(f"{'vars':>6} {'cells':>10} {'prepare (s)':>12}")
+    for n in sizes:
+        corr = random_corr(n)
+        t = time_prepare(corr, thresh_avg=0.001, thresh_mask=0.05)
+        print(f"{n:>6} {n*n:>10} {t:>12.4f}")
+
+    print()
+    print(f"{'vars':>6} {'render (s)':>12} {'drop_zeros (s)':>15} {'image (s)':>10}")
+    for n in [n for n in sizes if n <= 300]:
+        corr = random_corr(n)
+        full = time_render(corr, drop_zeros=False, backend='scatter')
+        dropped = time_render(corr, drop_zeros=True, backend='scatter')
+        image = time_render(corr, backend='image')
+        print(f"{n:>6} {full:>12.4f} {dropped:>15.4f} {image:>10.4f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [10, 50, 100, 300, 600, 1000, 1500]
+    main(sizes)
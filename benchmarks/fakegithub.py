@@ -0,0 +1,126 @@
+"""
+A local stand-in for Github, for benchmarking without a network: serves
+a synthetic repository of csv files through the trees api and the raw
+file server, with ETags. Point chart_tools at it with
+web.set_base_urls(server.api_url, server.raw_url).
+
+    server = FakeGithub(n_files=50, rows=10_000, cols=20, depth=2).start()
+    ...
+    server.stop()
+"""
+import json
+import time
+import threading
+from hashlib import sha1, md5
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pandas as pd
+
+USER, REPO, BRANCH = "bench", "data", "main"
+
+
+def synthetic_csv(rows, cols, seed) -> bytes:
+    """ Numeric columns, plus one low-cardinality string column """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(rows, cols)).round(4), columns=[f"x{i}" for i in range(cols)])
+    df['group'] = rng.choice(list("abcdefgh"), size=rows)
+    return df.to_csv(index=False).encode()
+
+
+class FakeGithub:
+    """
+    - n_files csv files of rows x cols, spread over directories
+      'depth' levels deep
+    - latency: seconds added to every response, to mimic a real network
+    - counts: requests served, by kind ('api', 'raw', 'not_modified')
+    """
+
+    def __init__(self, n_files=20, rows=5_000, cols=10, depth=1, latency=0.0, seed=0):
+        self.latency = latency
+        self.counts = {'api': 0, 'raw': 0, 'not_modified': 0}
+        self.files = {}
+        for i in range(n_files):
+            dirs = [f"dir{(i >> (2 * d)) % 4}" for d in range(depth)]
+            path = "/".join(dirs + [f"file{i}.csv"])
+            self.files[path] = synthetic_csv(rows, cols, seed + i)
+        self.server = None
+
+    @property
+    def tree(self) -> dict:
+        return {'sha': "0", 'tree': [
+            {'path': path, 'type': 'blob', 'size': len(data),
+             'sha': sha1(b"blob %d\0" % len(data) + data).hexdigest()}
+            for path, data in self.files.items()
+        ]}
+
+    def library(self, n_sources) -> dict:
+        """ Library json with n_sources sources, all pointing at this repo """
+        return {f"source{i}": {'u': USER, 'r': REPO, 'b': BRANCH, 'p': ""} for i in range(n_sources)}
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, body):
+                etag = f'"{md5(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    fake.counts['not_modified'] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                path = self.path.split("?")[0]
+                if path.startswith("/api/repos/"):
+                    fake.counts['api'] += 1
+                    if "/git/trees/" in path:
+                        return self.send_body(json.dumps(fake.tree).encode())
+                    return self.send_body(json.dumps({'default_branch': BRANCH}).encode())
+                if path.startswith("/raw/library/"):
+                    n = int(path.rsplit("/", 1)[-1].removesuffix(".json"))
+                    return self.send_body(json.dumps(fake.library(n)).encode())
+                if path.startswith("/raw/"):
+                    fake.counts['raw'] += 1
+                    rel = path.removeprefix(f"/raw/{USER}/{REPO}/{BRANCH}/")
+                    if rel in fake.files:
+                        return self.send_body(fake.files[rel])
+                self.send_response(404)
+                self.end_headers()
+
+        return Handler
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/api"
+
+    @property
+    def raw_url(self) -> str:
+        return f"{self.base_url}/raw"
+
+    def library_url(self, n_sources) -> str:
+        return f"{self.raw_url}/library/{n_sources}.json"
@@ -1,22 +1,55 @@
-# CHART STUFF
-from chart_tools.heatmaps.superheat import superheat
-from chart_tools.utils import set_style
+# Everything is imported lazily, on first access (PEP 562), so that
+# 'import chart_tools' is fast, and doesn't pull in pandas, matplotlib
+# or seaborn until they're needed.
+import importlib
 
-# DATA STUFF
-from chart_tools.data.source import (
-        Source,
-        )
-from chart_tools.data.datasource import (
-        DataSource
-        )
-from chart_tools.data.library import (
-        Library,
-        default_library,
-        default_lib,
-        load_data,
-        reset_library,
-        set_library,
-        df,
-        library_help,
-        )
+_lazy = {
+    # CHART STUFF
+    'superheat': 'chart_tools.heatmaps.superheat',
+    'superheat_from_data': 'chart_tools.heatmaps.superheat',
+    'superheat_grid': 'chart_tools.heatmaps.batch',
+    'superheat_files': 'chart_tools.heatmaps.batch',
+    'set_style': 'chart_tools.utils',
 
+    # DATA STUFF
+    'Source': 'chart_tools.data.source',
+    'set_offline': 'chart_tools.data.web',
+    'set_tree_cache': 'chart_tools.data.treecache',
+    'set_csv_engine': 'chart_tools.data.parsing',
+    'set_compaction': 'chart_tools.data.compaction',
+    'compaction_report': 'chart_tools.data.compaction',
+    'set_cache_dir': 'chart_tools.data.dfcache',
+    'set_cache_limit': 'chart_tools.data.dfcache',
+    'set_cache_copy_mode': 'chart_tools.data.dfcache',
+    'cache_info': 'chart_tools.data.dfcache',
+    'get_stats': 'chart_tools.data.stats',
+    'reset_stats': 'chart_tools.data.stats',
+    'add_hook': 'chart_tools.data.stats',
+    'remove_hook': 'chart_tools.data.stats',
+    'DataSource': 'chart_tools.data.datasource',
+    'Library': 'chart_tools.data.library',
+    'default_library': 'chart_tools.data.library',
+    'default_lib': 'chart_tools.data.library',
+    'load_data': 'chart_tools.data.library',
+    'aload_data': 'chart_tools.data.library',
+    'load_many': 'chart_tools.data.library',
+    'prefetch': 'chart_tools.data.library',
+    'reset_library': 'chart_tools.data.library',
+    'set_library': 'chart_tools.data.library',
+    'df': 'chart_tools.data.library',
+    'library_help': 'chart_tools.data.library',
+}
+
+__all__ = list(_lazy)
+
+
+def __getattr__(name):
+    if name in _lazy:
+        value = getattr(importlib.import_module(_lazy[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module 'chart_tools' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,87 @@
+"""
+Async counterparts of web.get_content, get_json and get_bytes, for
+Source.aload and friends.
+---
+With httpx installed, requests go through one pooled httpx.AsyncClient
+per event loop, so many downloads share a few connections without
+using a thread each. Without it, the blocking functions in web run in
+worker threads (asyncio.to_thread). Either way, ETags, offline state
+and stats are shared with web, so sync and async calls see the same
+remembered responses.
+"""
+
+import json
+import asyncio
+import weakref
+import requests
+
+from chart_tools.data import web
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+POOL_SIZE = 16 # Most open connections per event loop
+
+_clients = weakref.WeakKeyDictionary() # event loop -> httpx.AsyncClient
+
+
+def client():
+    """ The pooled httpx client for the running event loop """
+    loop = asyncio.get_running_loop()
+    c = _clients.get(loop)
+    if c is None or c.is_closed:
+        connect, read = web.TIMEOUT
+        c = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+                timeout=httpx.Timeout(read, connect=connect),
+                transport=httpx.AsyncHTTPTransport(retries=1),
+                )
+        _clients[loop] = c
+    return c
+
+
+async def aclose():
+    """ Close the running event loop's client and its connections """
+    c = _clients.pop(asyncio.get_running_loop(), None)
+    if c is not None:
+        await c.aclose()
+
+
+async def get_content(url, timeout=web.TIMEOUT) -> tuple:
+    """ Same as web.get_content: (status code, body bytes) """
+    if httpx is None:
+        return await asyncio.to_thread(web.get_content, url, timeout)
+
+    headers, known = web.conditional_headers(url)
+    if web.is_offline(url):
+        raise web.OfflineError(f"Offline, not requesting {url}")
+    connect, read = timeout
+    try:
+        res = await client().get(url, headers=headers, timeout=httpx.Timeout(read, connect=connect))
+    except httpx.TimeoutException as e:
+        # Only a host that can't be reached is offline, not a slow one
+        if isinstance(e, httpx.ConnectTimeout):
+            web.mark_offline(url)
+            raise requests.ConnectTimeout(str(e)) from e
+        raise requests.Timeout(str(e)) from e
+    except httpx.TransportError as e:
+        # Same errors as the sync functions raise, so callers handle both alike
+        if isinstance(e, httpx.ConnectError):
+            web.mark_offline(url)
+        raise requests.ConnectionError(str(e)) from e
+    return web.handle_response(url, res, known)
+
+
+async def get_json(url, timeout=web.TIMEOUT):
+    status, body = await get_content(url, timeout)
+    return json.loads(body)
+
+
+async def get_bytes(url, timeout=web.TIMEOUT) -> bytes:
+    """ Body of url. Raises for error status codes """
+    status, body = await get_content(url, timeout)
+    if status >= 400:
+        raise requests.HTTPError(f"{status} error for url: {url}")
+    return body
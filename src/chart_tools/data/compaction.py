@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from chart_tools.data.parsing import has_pyarrow
+
+# Options for compact(). See set_compaction
+DEFAULTS = {'downcast': True, 'int_floor': 'int32', 'categories': 0.5, 'strings': False}
+
+settings = None # Default compaction for Source.load. None when off
+
+report = {} # "source_id/name" -> {'before', 'after', 'saved'} bytes, for each compacted df
+
+
+def set_compaction(enabled=True, **options):
+    """
+    Shrink loaded dataframes before they're cached (see compact()).
+    Options override DEFAULTS. set_compaction(False) turns it off.
+    """
+    global settings
+    settings = resolve(True if enabled else False, options)
+
+
+def resolve(compact, options=None):
+    """
+    Settings dict for Source.load's compact argument, or None when off.
+    compact is None (use the default), a bool, or a dict of options.
+    """
+    if compact is None:
+        return settings
+    if compact is False:
+        return None
+    options = {**(compact if isinstance(compact, dict) else {}), **(options or {})}
+    unknown = set(options) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown compaction options: {sorted(unknown)}. Use {list(DEFAULTS)}")
+    if 'int_floor' in options and np.dtype(options['int_floor']).kind != 'i':
+        raise ValueError(f"int_floor must be a signed integer type, not {options['int_floor']}")
+    if options.get('strings') and not has_pyarrow():
+        raise ImportError("Compacting to pyarrow strings needs pyarrow: pip install pyarrow")
+    return {**DEFAULTS, **options}
+
+
+def settings_key(settings:dict) -> str:
+    """ Settings as a string, for cache keys """
+    return repr(tuple(sorted(settings.items())))
+
+
+def compact(df:pd.DataFrame, downcast=True, int_floor='int32', categories=0.5, strings=False) -> pd.DataFrame:
+    """
+    Same data, in less memory.
+    ---
+    - downcast: integers to the smallest signed int type that holds
+      them, but no smaller than int_floor. Floats to float32, only if no
+      value changes.
+    - int_floor: smallest int type to downcast to. Arithmetic on small
+      int types wraps around silently when a result doesn't fit (int8
+      100 * 3 is 44), so the default keeps int32's range. Unsigned types
+      are never used: subtracting would wrap below zero.
+    - categories: string columns where the share of unique values is at
+      most this become 'category'. None or 0 to skip.
+    - strings: other string columns become pyarrow strings
+    Columns that already have pyarrow or extension dtypes are left alone.
+    """
+    casts = {}
+    for col in df.columns:
+        s = df[col]
+        kind = s.dtype.kind if isinstance(s.dtype, np.dtype) else None
+
+        if downcast and kind in ('i', 'u') and len(s):
+            small = pd.to_numeric(s, downcast='integer').dtype
+            if small.kind != 'i':
+                continue # Too big for int64
+            small = np.promote_types(small, int_floor)
+            if small.itemsize < s.dtype.itemsize:
+                casts[col] = small
+
+        elif downcast and kind == 'f' and s.dtype != np.float32:
+            values = s.to_numpy()
+            small = values.astype(np.float32)
+            if np.array_equal(small.astype(values.dtype), values, equal_nan=True):
+                casts[col] = np.float32
+
+        elif kind == 'O' or isinstance(s.dtype, pd.StringDtype):
+            if categories and len(s) and s.nunique() <= categories * len(s):
+                casts[col] = 'category'
+            elif strings:
+                casts[col] = 'string[pyarrow]'
+
+    return df.astype(casts) if casts else df
+
+
+def compaction_report() -> pd.DataFrame:
+    """ Memory before and after compaction, for each compacted dataset """
+    df = pd.DataFrame.from_dict(report, orient='index', columns=['before', 'after', 'saved'])
+    df['ratio'] = df['before'] / df['after']
+    return df
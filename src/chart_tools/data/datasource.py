@@ -1,5 +1,5 @@
 from chart_tools.data.source import Source
-import requests
+from chart_tools.data import web, stats
 
 # TODO:
 # DataSource version of .load() should work like the
@@ -108,14 +108,15 @@ class DataSource(Source):
                 )
 
 
+    @stats.timed('request_branch')
     def request_branch(self, user, repo):
         """
         Called from init when only name and repo are known.
         Called from init_from_url when ROOT link to repo is passed, in which
         case the branch is unknown.
         """
-        req_url = f"https://api.github.com/repos/{user}/{repo}?recursive=1"
-        res = requests.get(req_url).json()
+        req_url = web.api_url(f"repos/{user}/{repo}")
+        res = web.get_json(req_url)
         return res['default_branch']
 
 
@@ -132,28 +133,28 @@ class DataSource(Source):
             if self.name == None:
                 print(f"Datasets in '{self.user}/{self.repo}/{self.path}':")
             if len(self.subdirs) > 0:
-                print("(refer files inside folders using the full path. Ex: 'folder/file')")
+                print("(refer to files by name, or by full path if the name isn't unique. Ex: 'folder/file')")
             print("---------------------------")
         
-        # Files in base directory
-        for file in [f for f in self.datasets if "/" not in f]:
-            print(f"  {file}")
-
-        # Files in subdirectories
-        count = 0
-        for dir in self.subdirs:
-            print(f"  {dir}/")
+        # Walk the directory tree lazily, so only printed lines cost anything
+        def lines(dir, depth):
+            indent = "  " * (depth + 1)
+            for file in self.files_in(dir):
+                yield f"{indent}{file}", True
+            for sub in self.subdirs_of(dir):
+                yield f"{indent}{sub.rsplit('/', 1)[-1]}/", False
+                yield from lines(sub, depth + 1)
+
+        count, files = 0, 0
+        for line, is_file in lines("", 0):
             count += 1
-            for f in self.dir_contents(dir):
-                count += 1
-                if count > trunc: break
-                print(f"    {f}")
-
             if count > trunc: break
+            files += is_file
+            print(line)
 
         if count > trunc:
             name = self.name if self.name else f"{self.user}/{self.repo}"
-            print(f"      ({len(self.datasets)-count} more files in {name})")
+            print(f"      ({len(self.datasets)-files} more files in {name})")
     
 
     def display_subdirs(self, header=False):
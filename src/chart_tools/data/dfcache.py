@@ -1,7 +1,147 @@
 import pandas as pd
+import numpy as np
 import os
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
 
+from chart_tools.data.diskcache import DiskCache
+from chart_tools.data.parsing import has_pyarrow
+from chart_tools.data import stats
+
+
+def cow_enabled() -> bool:
+    """
+    Whether pandas copy-on-write is on. Always true from pandas 3.
+    """
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    return pd.options.mode.copy_on_write is True
+
+
+def read_only_view(df:pd.DataFrame) -> pd.DataFrame:
+    """
+    New df over the same data as df, that can't be modified in place,
+    for pandas without copy-on-write. Each numpy-backed column is a
+    read-only numpy view of df's, so writing into it raises instead of
+    changing df, while df itself stays writable. Other columns
+    (categorical, arrow...) get their own copy, which is cheap for arrow.
+    Adding or replacing whole columns works as usual, and leaves df alone.
+    """
+    columns = {}
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        if isinstance(col.dtype, np.dtype):
+            values = col.to_numpy(copy=False).view()
+            values.flags.writeable = False
+        else:
+            values = col.array.copy()
+        columns[i] = values
+    # Numbered columns, so duplicate names survive. copy=False keeps
+    # pandas from consolidating the views into new blocks
+    view = pd.DataFrame(columns, index=df.index, copy=False)
+    view.columns = df.columns
+    return view
+
+
+def normalize_kwargs(**kwargs) -> dict:
+    """
+    Canonical form of read_csv kwargs: sorted by name, with lists made
+    into tuples. Order doesn't matter to pandas for usecols, or for the
+    keys of a dtype dict, so those are sorted too.
+    """
+    def normalize(name, value):
+        if isinstance(value, dict):
+            return dict(sorted(value.items(), key=lambda kv: repr(kv[0])))
+        if isinstance(value, (list, tuple, set, pd.Index)):
+            value = tuple(value)
+            if name == 'usecols' or isinstance(value, set):
+                value = tuple(sorted(value, key=repr))
+        return value
+    return {k: normalize(k, v) for k, v in sorted(kwargs.items())}
+
+
+def kwargs_key(**kwargs) -> str:
+    """
+    Normalized string form of read_csv kwargs, independent of the
+    order they were passed in. See normalize_kwargs
+    """
+    return repr(tuple(normalize_kwargs(**kwargs).items()))
+
+
+# read_csv kwargs that a cached df can be narrowed down to, without
+# downloading again. See derive()
+DERIVABLE_KWARGS = ('usecols', 'nrows', 'dtype')
+
+# Cache kwargs for processing after read_csv. A df loaded with them isn't
+# what read_csv returned, so no other version can be derived from it:
+# a transform would see different rows or columns, and compaction picks
+# dtypes from the values it's given.
+UNDERIVABLE_KWARGS = ('transform', 'compact')
+
+
+def derive(df:pd.DataFrame, cached:dict, wanted:dict):
+    """
+    Build the df that read_csv(**wanted) would give, from a df that was
+    loaded with read_csv(**cached), when possible. Both are normalized
+    kwargs. Returns None if wanted isn't a subset of cached.
+    ---
+    - usecols: column names only, picked from the cached columns
+    - nrows: first rows of a df with more (or all) rows
+    - dtype: per-column numeric casts, or conversion to 'category'
+    Derived dfs keep the dtypes inferred when the cached df was loaded.
+    Never derives from a transformed or compacted df (see UNDERIVABLE_KWARGS).
+    """
+    if any(k in cached for k in UNDERIVABLE_KWARGS):
+        return None
+    others = lambda kw: {k: v for k, v in kw.items() if k not in DERIVABLE_KWARGS}
+    if others(cached) != others(wanted):
+        return None
+
+    # Columns
+    if 'usecols' in wanted:
+        usecols = wanted['usecols']
+        if callable(usecols) or 'index_col' in wanted:
+            return None
+        if not all(isinstance(c, str) and c in df.columns for c in usecols):
+            return None
+        keep = set(usecols)
+        df = df[[c for c in df.columns if c in keep]]
+    elif 'usecols' in cached:
+        return None
+
+    # Rows
+    if 'nrows' in cached and wanted.get('nrows', float('inf')) > cached['nrows']:
+        return None
+    if 'nrows' in wanted:
+        if 'skipfooter' in wanted:
+            return None
+        df = df.iloc[:wanted['nrows']]
+
+    # Types
+    have, want = cached.get('dtype', {}), wanted.get('dtype', {})
+    if not isinstance(have, dict) or not isinstance(want, dict):
+        return df if have == want else None
+    for col, t in have.items():
+        if col in df.columns and want.get(col) != t:
+            return None
+    casts = {}
+    for col, t in want.items():
+        if col not in df.columns or have.get(col) == t:
+            continue
+        if t == 'category':
+            casts[col] = t
+            continue
+        try:
+            src, dst = df[col].dtype, pd.api.types.pandas_dtype(t)
+        except TypeError:
+            return None
+        if src.kind in 'iu' and dst.kind in 'iuf' or src.kind == 'f' and dst.kind == 'f':
+            casts[col] = dst
+        else:
+            return None
+    return df.astype(casts) if casts else df
+
 
 @dataclass
 class DFCache:
@@ -15,53 +155,212 @@ class DFCache:
     dataframe will be missing its first column. If the user
     tries to load it again, without this keyword argument,
     we DO NOT want to return the cached data, and instead
-    must download it again and replace the cache. To do this,
-    we cast kwargs to a string, and store it beside the df.
+    must download it again. To do this, each df is keyed by its
+    filename AND a canonical string of its kwargs (see kwargs_key), so
+    one file can be cached several times with different kwargs.
     For a given filename, two dataframes are considered equal
     if their kwargs are the same.
     ---
+    When a file is requested with kwargs that only narrow down a cached
+    version (fewer usecols, fewer nrows, a smaller dtype), the result is
+    derived from that cached df instead of downloaded. See derive()
+    ---
     Structure of self.__cache:
     {
-        "some-filename": {
+        ("some-filename", kwargs_key(**kwargs)): {
+            "name": "some-filename",
             "df": pd.DataFrame(),
-            "kwargs": str(**kwargs)
+            "kwargs": normalize_kwargs(**kwargs),
+            "nbytes": df.memory_usage(deep=True).sum(),
+            "hits": 0,
+            "sha": "<git blob sha of the file when loaded>" (or None)
         },
-        "other_filename": {
+        ("some-filename", kwargs_key(**other_kwargs)): {
             . . .
         }
     }
     ---
+    The cache is bounded by max_bytes (see set_cache_limit). When adding
+    a df would go over budget, entries are evicted: least recently used
+    first ('lru'), or least frequently used ('lfu'). Hit, miss and
+    eviction counters are kept in stats (see info()).
+    ---
+    get() never hands out the cached df itself. With copy_mode 'lazy'
+    (the default), it returns a shallow copy under pandas copy-on-write,
+    which costs nothing until the copy is modified, and even then never
+    touches the cached original. Without copy-on-write (pandas < 3 with
+    the option off) 'lazy' falls back to a full copy, as does 'copy'.
+    'view' returns a shallow copy under copy-on-write too, and a
+    read-only view without it (see read_only_view): just as cheap, but
+    modifying it in place raises.
+    ---
+    An optional disk tier (see DiskCache and set_cache_dir) keeps
+    dataframes across kernel restarts. Source.load checks memory first,
+    then disk, then the network.
+    ---
+    Each entry records the git blob sha of the file it was loaded from.
+    When the source's file listing shows a different sha, the file has
+    changed, and its cached versions are dropped (see expire()).
+    ---
     DataSource, Source, and Library are meant for Jupyter notebooks,
     where the biggest performance gain is to be had from caching. They should
     never be used in a production setting, as they would be very slow.
     """
-    __cache = dict()
+    __cache = OrderedDict() # Ordered from least to most recently used
+    __lock = threading.RLock()
+    disk = None # DiskCache, shared by all sources. None if disabled
+    max_bytes = None # Memory budget for all cached dfs. None for no limit
+    policy = 'lru' # Eviction policy: 'lru' or 'lfu'
+    copy_mode = 'lazy' # How get() copies: 'lazy', 'view' or 'copy'
+    stats = {'hits': 0, 'misses': 0, 'evictions': 0}
 
     @property
     def cache(self) -> dict:
         return self.__cache
 
+    @property
+    def nbytes(self) -> int:
+        return sum(item['nbytes'] for item in self.cache.values())
+
     def has_key(self, key) -> bool:
-        return key in self.__cache.keys()
+        """ Whether any version of file 'key' is cached """
+        return any(name == key for name, _ in list(self.cache.keys()))
 
-    def df_matches(self, key, **kwargs) -> bool:
-        if self.has_key(key):
-            return self.cache[key]['kwargs'] == str(kwargs)
-        return False
+    def variants(self, key) -> list:
+        """ Cache keys for every version of file 'key' """
+        return [k for k in list(self.cache.keys()) if k[0] == key]
 
-    def add(self, key, df, **kwargs):
-        self.cache[key] = {'df':df, 'kwargs': str(kwargs)}
+    def find(self, key, **kwargs):
+        """
+        (cache key, df) for the version of file 'key' loaded with kwargs,
+        either cached exactly or derived from a cached superset.
+        None if neither exists.
+        """
+        exact = (key, kwargs_key(**kwargs))
+        item = self.cache.get(exact)
+        if item is not None:
+            return exact, item['df']
+        wanted = normalize_kwargs(**kwargs)
+        for k in reversed(self.variants(key)):
+            item = self.cache.get(k)
+            if item is None:
+                continue
+            df = derive(item['df'], item['kwargs'], wanted)
+            if df is not None:
+                return k, df
+        return None
 
-    def pop(self, key) -> bool:
-        if self.has_key(key):
-            self.cache.pop(key)
+    def df_matches(self, key, **kwargs) -> bool:
+        if self.find(key, **kwargs) is not None:
             return True
+        self.stats['misses'] += 1
+        stats.count('cache.misses', file=key)
         return False
 
-    def get(self, key) -> pd.DataFrame():
-        if self.has_key(key):
-            return self.cache[key]['df'].copy()
-        return pd.DataFrame()
+    def add(self, key, df, sha=None, **kwargs) -> bool:
+        """
+        Cache df, evicting others if needed to stay within max_bytes.
+        Returns False if df alone is bigger than max_bytes, and wasn't cached.
+        - sha: git blob sha of the file df was loaded from, if known
+        """
+        nbytes = int(df.memory_usage(deep=True).sum())
+        with self.__lock:
+            self.pop(key, **kwargs)
+            if self.max_bytes is not None:
+                if nbytes > self.max_bytes:
+                    return False
+                self.evict(self.max_bytes - nbytes)
+            self.cache[(key, kwargs_key(**kwargs))] = {
+                'name': key,
+                'df': df,
+                'kwargs': normalize_kwargs(**kwargs),
+                'nbytes': nbytes,
+                'hits': 0,
+                'sha': sha,
+            }
+        return True
+
+    def expire(self, key, sha) -> bool:
+        """
+        Remove every version of file 'key' loaded from other contents
+        than sha. Versions with no recorded sha are kept.
+        """
+        if sha is None:
+            return False
+        with self.__lock:
+            stale = [k for k in self.variants(key) if self.cache[k].get('sha') not in (None, sha)]
+            for k in stale:
+                self.cache.pop(k)
+            return len(stale) > 0
+
+    def evict(self, max_bytes):
+        """ Drop entries, by policy, until cache uses at most max_bytes """
+        with self.__lock:
+            total = self.nbytes
+            while self.cache and total > max_bytes:
+                if self.policy == 'lfu':
+                    key = min(self.cache, key=lambda k: self.cache[k]['hits'])
+                else:
+                    key = next(iter(self.cache))
+                total -= self.cache.pop(key)['nbytes']
+                self.stats['evictions'] += 1
+                stats.count('cache.evictions', file=key[0])
+
+    def pop(self, key, **kwargs) -> bool:
+        """ Remove the version of file 'key' loaded with exactly kwargs """
+        with self.__lock:
+            return self.cache.pop((key, kwargs_key(**kwargs)), None) is not None
+
+    def remove(self, key) -> bool:
+        """ Remove every version of file 'key' """
+        with self.__lock:
+            variants = self.variants(key)
+            for k in variants:
+                self.cache.pop(k)
+            return len(variants) > 0
+
+    def clear(self):
+        """ Remove every cached df """
+        with self.__lock:
+            self.cache.clear()
+
+    def get(self, key, **kwargs) -> pd.DataFrame():
+        """
+        Copy of file 'key' as loaded with kwargs. Without kwargs, and
+        no version loaded without kwargs, the most recently used version.
+        """
+        with self.__lock:
+            found = self.find(key, **kwargs)
+            if found is None and not kwargs and self.has_key(key):
+                k = self.variants(key)[-1]
+                found = k, self.cache[k]['df']
+            if found is None:
+                return pd.DataFrame()
+            k, df = found
+            self.stats['hits'] += 1
+            stats.count('cache.hits', file=key)
+            self.cache[k]['hits'] += 1
+            self.cache.move_to_end(k)
+            return self.copy(df)
+
+    def copy(self, df) -> pd.DataFrame:
+        """ What get() returns for a cached df """
+        if self.copy_mode in ('lazy', 'view') and cow_enabled():
+            return df.copy(deep=False)
+        if self.copy_mode == 'view':
+            return read_only_view(df)
+        stats.count('cache.copy_bytes', int(df.memory_usage(deep=False).sum()))
+        return df.copy()
+
+    def info(self) -> dict:
+        """ Counters and memory use of the cache """
+        return {
+            **self.stats,
+            'entries': len(self.cache),
+            'nbytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'policy': self.policy,
+        }
 
 
     def to_csv(self, dir="", **kwargs):
@@ -73,7 +372,48 @@ class DFCache:
             if not os.path.exists(dir):
                 os.mkdir(dir)
             dir = f"{dir}/"
-        for name, item in self.cache.items():
-            item['df'].to_csv(f"{dir}{name}.csv", **kwargs)
+        # Most recently used version of each file
+        latest = {item['name']: item['df'] for item in self.cache.values()}
+        for name, df in latest.items():
+            df.to_csv(f"{dir}{name}.csv", **kwargs)
+
+
+
+
+def set_cache_dir(dir=None, format='parquet'):
+    """
+    Turn on the disk tier of the cache, stored in dir, using 'parquet'
+    or 'feather' files. Pass None to turn it off again. Needs pyarrow.
+    """
+    if dir and not has_pyarrow():
+        raise ImportError("The disk cache needs pyarrow, for parquet and feather files: pip install pyarrow")
+    DFCache.disk = DiskCache(dir, format) if dir else None
+
+
+def set_cache_limit(max_bytes=None, policy='lru'):
+    """
+    Limit the memory used by cached dfs to max_bytes, evicting by
+    policy ('lru' or 'lfu') when over budget. None removes the limit.
+    """
+    if policy not in ('lru', 'lfu'):
+        raise ValueError(f"Unknown policy, '{policy}'. Use 'lru' or 'lfu'")
+    DFCache.max_bytes = max_bytes
+    DFCache.policy = policy
+    if max_bytes is not None:
+        DFCache().evict(max_bytes)
+
+
+def set_cache_copy_mode(mode='lazy'):
+    """
+    'lazy' returns copy-on-write copies of cached dfs, which are free
+    until modified, or full copies without copy-on-write. 'view' is the
+    same, except it returns read-only views without copy-on-write.
+    'copy' always returns a full copy.
+    """
+    if mode not in ('lazy', 'view', 'copy'):
+        raise ValueError(f"Unknown copy mode, '{mode}'. Use 'lazy', 'view' or 'copy'")
+    DFCache.copy_mode = mode
 
 
+def cache_info() -> dict:
+    return DFCache().info()
@@ -0,0 +1,143 @@
+import pandas as pd
+import os
+import json
+import threading
+from hashlib import md5
+
+
+class DiskCache:
+    """
+    Optional second tier for DFCache: keeps loaded dataframes on disk
+    as parquet or feather files, so they survive a kernel restart.
+    ---
+    Each file is keyed by the source it came from (user/repo/branch/path),
+    the file name, and the read_csv kwargs used to load it. Next to each
+    '<key>.parquet' is its own small manifest entry, '<key>.json':
+    {
+        "source": "user/repo/branch/path",
+        "name": "some-filename",
+        "kwargs": "{...}",
+        "file": "<key>.parquet",
+        "sha": "<git blob sha of the csv when loaded>" (or null)
+    }
+    Entries are read from disk on every lookup, and written atomically,
+    one per key, so several kernels can share a cache dir without
+    overwriting each other's entries.
+    ---
+    Parquet and feather both need pyarrow installed. Dataframes that
+    can't be written in the chosen format (non-string column names, for
+    instance) are simply not stored.
+    """
+    formats = ('parquet', 'feather')
+
+    def __init__(self, dir, format='parquet'):
+        if format not in self.formats:
+            raise ValueError(f"Unknown format, '{format}'. Use 'parquet' or 'feather'")
+        self.dir = dir
+        self.format = format
+        os.makedirs(dir, exist_ok=True)
+
+    @property
+    def manifest(self) -> dict:
+        """ {key: entry} for everything on disk """
+        entries = {}
+        for file in os.listdir(self.dir):
+            if file.endswith(".json"):
+                entry = self.read_entry(file.removesuffix(".json"))
+                if entry is not None:
+                    entries[file.removesuffix(".json")] = entry
+        return entries
+
+    def entry_path(self, key) -> str:
+        return os.path.join(self.dir, f"{key}.json")
+
+    def read_entry(self, key):
+        try:
+            with open(self.entry_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_entry(self, key, entry:dict):
+        replace(self.entry_path(key), lambda tmp: json_dump(entry, tmp))
+
+    @staticmethod
+    def key(source, name, kwargs:str) -> str:
+        return md5(f"{source}|{name}|{kwargs}".encode()).hexdigest()
+
+    def has(self, source, name, kwargs:str) -> bool:
+        return os.path.exists(self.entry_path(self.key(source, name, kwargs)))
+
+    def get(self, source, name, kwargs:str, sha=None):
+        """
+        Cached dataframe, or None if it isn't on disk. If sha is given
+        and differs from the one recorded, the file changed since it was
+        cached: the stale copy is removed, and None returned.
+        """
+        entry = self.read_entry(self.key(source, name, kwargs))
+        if entry is None:
+            return None
+        if sha is not None and entry.get('sha') not in (None, sha):
+            self.pop(source, name, kwargs)
+            return None
+        path = os.path.join(self.dir, entry['file'])
+        try:
+            if self.format == 'parquet':
+                return pd.read_parquet(path)
+            return pd.read_feather(path)
+        except Exception:
+            # Missing or unreadable file: forget it, and load from the network
+            self.pop(source, name, kwargs)
+            return None
+
+    def add(self, source, name, df:pd.DataFrame, kwargs:str, sha=None) -> bool:
+        key = self.key(source, name, kwargs)
+        file = f"{key}.{self.format}"
+        write = df.to_parquet if self.format == 'parquet' else df.to_feather
+        try:
+            replace(os.path.join(self.dir, file), write)
+        except Exception:
+            return False
+        self.write_entry(key, {'source': source, 'name': name, 'kwargs': kwargs, 'file': file, 'sha': sha})
+        return True
+
+    def pop(self, source, name, kwargs:str) -> bool:
+        key = self.key(source, name, kwargs)
+        entry = self.read_entry(key)
+        if entry is None:
+            return False
+        # Entry first: a data file without one is never read
+        remove(self.entry_path(key))
+        remove(os.path.join(self.dir, entry['file']))
+        return True
+
+    def clear(self):
+        for key, entry in self.manifest.items():
+            remove(self.entry_path(key))
+            remove(os.path.join(self.dir, entry['file']))
+
+
+def json_dump(obj, path):
+    with open(path, "w") as f:
+        json.dump(obj, f, indent=1)
+
+
+def replace(path, write):
+    """
+    write(tmp) to a temp file unique to this process and thread, then
+    move it to path, so readers never see half a file, and concurrent
+    writers never mix theirs
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        remove(tmp)
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,7 +1,13 @@
 from chart_tools.data.datasource import DataSource
+from chart_tools.data.source import load_jobs
 from operator import countOf
 import pandas as pd
+import json
+import asyncio
 import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from chart_tools.data import web, treecache
 
 class Library:
     """
@@ -29,18 +35,35 @@ class Library:
         }
     }
     ---
-    A default instance, 'default_lib' is declared immediately at import,
-    linking to a library stored at: ryayoung/datasets/chart-tools-default-library.json
+    A default instance, 'default_library' is declared at import, linking
+    to a library stored at: ryayoung/datasets/chart-tools-default-library.json
+    It's lazy: nothing is requested until its sources are first needed.
     """
     load_help = True
     load_help_all = True
+    max_workers = 8 # Most sources' file trees requested at once, by prefetch()
 
-    def __init__(self, url):
+    def __init__(self, url, lazy=False):
         self.url = url
         self.data = None
-        self.sources = None
+        self._sources = None
+        self._loaded = False
+
+        if not lazy:
+            self.set(self.url)
+
+    @property
+    def sources(self) -> dict:
+        """
+        DataSources by name. A lazy library loads them on first access
+        """
+        if not self._loaded:
+            self.set(self.url)
+        return self._sources
 
-        self.set(self.url)
+    @sources.setter
+    def sources(self, value):
+        self._sources = value
 
     def __repr__(self):
         if self.sources != None:
@@ -50,14 +73,16 @@ class Library:
             return string
         
     def set(self, url):
+        self._loaded = True
+
         # Dict
         if type(url) == dict:
             self.data = url
 
         # Online library
-        elif url.startswith("https"):
+        elif url.startswith(("https://", "http://")):
             try:
-                self.data = dict(requests.get(url).json())
+                self.data = self.fetch(url)
             except Exception as e:
                 print("Error getting library data")
                 self.data = None
@@ -79,7 +104,89 @@ class Library:
             self.url = url
             self.sources = { k: DataSource(v['u'], v['r'], v['b'], v['p'], name=k) for k, v in self.data.items() }
 
+
+    @staticmethod
+    def fetch(url) -> dict:
+        """
+        Library json at url. Kept in the listing cache (see TreeCache):
+        used as is within its ttl, revalidated after that, and used
+        anyway if the url can't be reached, or while offline.
+        """
+        trees = treecache.tree_cache
+        entry = trees.get_library(url) if trees else None
+        if entry and trees.fresh(entry):
+            return entry['data']
+        if entry:
+            web.prime(url, json.dumps(entry['data']).encode(), entry.get('etag'), entry.get('last_modified'))
+        try:
+            data = dict(web.get_json(url))
+        except (requests.ConnectionError, requests.Timeout):
+            if entry:
+                return entry['data']
+            raise
+        if trees:
+            trees.add_library(url, data, **web.validators(url))
+        return data
+
     
+    def prefetch(self, refresh=False, max_workers=None, sources=None) -> None:
+        """
+        Requests the file trees of all sources at once, instead of one
+        after another as each source's datasets are accessed. Takes about
+        as long as the slowest source.
+        ---
+        - refresh: request trees again, even for sources already loaded,
+          and even if a cached listing is still fresh
+        - max_workers: most requests at once. Default: Library.max_workers
+        - sources: names of the sources to request. Default: all
+        """
+        if not self.sources:
+            return
+
+        todo = [
+            s for name, s in self.sources.items()
+            if (sources is None or name in sources) and (refresh or not s.has_datasets)
+        ]
+        if not todo:
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers or Library.max_workers) as pool:
+            futures = {s.name: pool.submit(s.refresh_datasets, refresh) for s in todo}
+            for name, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error getting datasets for '{name}': {e}")
+
+
+    async def aprefetch(self, refresh=False, max_workers=None, sources=None) -> None:
+        """ Async prefetch(), on the event loop instead of threads """
+        if not await self.asources():
+            return
+
+        todo = [
+            s for name, s in self.sources.items()
+            if (sources is None or name in sources) and (refresh or not s.has_datasets)
+        ]
+        limit = asyncio.Semaphore(max_workers or Library.max_workers)
+
+        async def one(s):
+            async with limit:
+                await s.arefresh_datasets(refresh)
+
+        results = await asyncio.gather(*(one(s) for s in todo), return_exceptions=True)
+        for s, res in zip(todo, results):
+            if isinstance(res, Exception):
+                print(f"Error getting datasets for '{s.name}': {res}")
+
+
+    async def asources(self) -> dict:
+        """ sources, loading the library in a worker thread if it's lazy """
+        if not self._loaded:
+            await asyncio.to_thread(lambda: self.sources)
+        return self.sources
+
+
     def display_sources(self) -> None:
         """ Just source names and github links """
         if self.sources:
@@ -94,7 +201,8 @@ class Library:
         """
         if not self.sources:
             return
-        
+
+        self.prefetch()
         for s in self.sources.values():
             if s.datasets == []:
                 continue
@@ -145,7 +253,7 @@ class Library:
             if "main" in self.sources:
                 # Shorthand: access contents of 'main' datasource
                 # by providing only the filename!
-                if source in self.sources.get("main", {}).datasets:
+                if self.sources["main"].resolve(source) is not None:
                     return self.sources['main'].load(source, save, **kwargs)
 
             print(f"Unknown source, '{source}'")
@@ -159,6 +267,72 @@ class Library:
             return self.sources[source].load(file, save, **kwargs)
 
 
+    async def aload_data(self, source:str=None, file:str=None, save=True, **kwargs) -> pd.DataFrame:
+        """
+        Async load_data(). Loading a file awaits Source.aload. Anything
+        else (help and listings) runs load_data() in a worker thread.
+        """
+        sources = await self.asources()
+        if not sources:
+            return
+
+        if file and source in sources:
+            return await sources[source].aload(file, save, **kwargs)
+
+        if source and not file and source not in sources and "main" in sources:
+            main = sources["main"]
+            if not main.has_datasets:
+                await main.arefresh_datasets()
+            if main.resolve(source) is not None:
+                return await main.aload(source, save, **kwargs)
+
+        return await asyncio.to_thread(self.load_data, source, file, save, **kwargs)
+
+
+    def load_many(self, items, save=True, max_workers=8, **kwargs) -> dict:
+        """
+        Loads several (source, file) pairs. The file listings of those
+        sources are fetched at once, and all names resolved, before anything
+        downloads. Cached files are served right away, and the rest
+        downloaded max_workers at a time. Asking for the same file twice
+        downloads it once.
+        - kwargs: same as load_data(), for every file
+        Returns {(source, file): df}, in the order given
+        """
+        items = [tuple(item) for item in items]
+        unknown = [source for source, _ in items if source not in self.sources]
+        if unknown:
+            raise ValueError(f"Unknown sources: {unknown}")
+
+        self.prefetch(sources={source for source, _ in items})
+        jobs = {
+            (source, file): (self.sources[source], self.sources[source].lookup(file)[0])
+            for source, file in items
+        }
+        return load_jobs(jobs, save, max_workers, **kwargs)
+
+
+    async def aload_many(self, items, max_concurrency=16, **kwargs) -> dict:
+        """
+        Async load of several (source, file) pairs at once, at most
+        max_concurrency at a time. Returns {(source, file): df}
+        """
+        sources = await self.asources()
+        unknown = [source for source, _ in items if source not in sources]
+        if unknown:
+            raise ValueError(f"Unknown sources: {unknown}")
+
+        await self.aprefetch(sources={source for source, _ in items}) # Their listings at once, before any file
+        limit = asyncio.Semaphore(max_concurrency)
+
+        async def one(source, file):
+            async with limit:
+                return await sources[source].aload(file, **kwargs)
+
+        dfs = await asyncio.gather(*(one(source, file) for source, file in items))
+        return dict(zip(map(tuple, items), dfs))
+
+
     def df(self, filename) -> pd.DataFrame:
         """
         Looks for filename in the cache of EACH datasource
@@ -193,7 +367,9 @@ class Library:
 
 
 # --------------------------------------------------------------------------------
-default_library = Library("https://raw.githubusercontent.com/ryayoung/datasets/main/chart-tools-default-library.json")
+DEFAULT_LIBRARY_URL = "https://raw.githubusercontent.com/ryayoung/datasets/main/chart-tools-default-library.json"
+
+default_library = Library(DEFAULT_LIBRARY_URL, lazy=True)
 
 
 def default_lib_url():
@@ -201,7 +377,7 @@ def default_lib_url():
 
 
 def reset_library():
-    default_library.set("https://raw.githubusercontent.com/ryayoung/datasets/main/chart-tools-default-library.json")
+    default_library.set(DEFAULT_LIBRARY_URL)
 
 
 def default_lib():
@@ -212,10 +388,22 @@ def set_library(url):
     default_library.set(url)
 
 
+def prefetch(refresh=False, max_workers=None, sources=None):
+    default_library.prefetch(refresh, max_workers, sources)
+
+
 def load_data(source=None, file=None, save=True, **kwargs) -> pd.DataFrame:
     return default_library.load_data(source, file, save, **kwargs)
 
 
+async def aload_data(source=None, file=None, save=True, **kwargs) -> pd.DataFrame:
+    return await default_library.aload_data(source, file, save, **kwargs)
+
+
+def load_many(items, save=True, max_workers=8, **kwargs) -> dict:
+    return default_library.load_many(items, save, max_workers, **kwargs)
+
+
 def df(fname) -> pd.DataFrame:
     return default_library.df(fname)
 
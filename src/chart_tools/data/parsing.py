@@ -0,0 +1,51 @@
+import importlib.util
+
+ENGINES = ('c', 'pyarrow')
+
+# read_csv options the pyarrow engine doesn't support. Loads that use
+# any of them fall back to the C engine
+PYARROW_UNSUPPORTED = (
+    'chunksize', 'comment', 'converters', 'dayfirst', 'dialect',
+    'float_precision', 'iterator', 'lineterminator', 'low_memory',
+    'memory_map', 'nrows', 'quoting', 'skipfooter', 'skipinitialspace',
+    'thousands',
+)
+
+csv_engine = 'c' # Default engine for Source.load, see set_csv_engine
+
+
+def has_pyarrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def set_csv_engine(engine='c'):
+    """
+    Default csv parser for loading data.
+    - 'c': pandas' C parser, with numpy dtypes
+    - 'pyarrow': pyarrow's multithreaded csv reader, with pyarrow-backed
+      dtypes. Much faster on big, wide files. Needs pyarrow installed.
+    """
+    global csv_engine
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine, '{engine}'. Use 'c' or 'pyarrow'")
+    if engine == 'pyarrow' and not has_pyarrow():
+        raise ImportError("The 'pyarrow' engine needs pyarrow: pip install pyarrow")
+    csv_engine = engine
+
+
+def read_kwargs(engine=None, **kwargs) -> dict:
+    """
+    read_csv kwargs for parsing with engine (default: csv_engine).
+    Engine options become ordinary read_csv kwargs, so they are part of
+    the cache key like any other. Falls back to the C engine, adding
+    nothing, when pyarrow isn't installed, when kwargs use an option it
+    doesn't support, or when kwargs already choose an engine.
+    """
+    engine = engine or csv_engine
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine, '{engine}'. Use 'c' or 'pyarrow'")
+    if engine == 'c' or 'engine' in kwargs:
+        return kwargs
+    if not has_pyarrow() or any(k in kwargs for k in PYARROW_UNSUPPORTED):
+        return kwargs
+    return {'engine': 'pyarrow', 'dtype_backend': 'pyarrow', **kwargs}
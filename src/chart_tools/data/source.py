@@ -1,25 +1,137 @@
 from dataclasses import dataclass
-from operator import countOf
 import pandas as pd
 import requests
 import json
 import os
-from hashlib import md5
+import io
+import time
+import asyncio
+import threading
+from hashlib import md5, sha1
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
 
-from chart_tools.data.dfcache import DFCache
+from chart_tools.data.dfcache import DFCache, kwargs_key
+from chart_tools.data import web, aweb, treecache, parsing, compaction, stats
 
-# TODO:
-# load() function won't find base filenames when subdirectories
-# go more than 1 layer deep
+CHUNKSIZE = 100_000 # Rows per chunk, when loading a file in chunks
 
+def check_internet(url=None):
+    """
+    Don't do internet stuff if no internet. Makes no request: a host is
+    only considered offline after a real request to it failed to connect
+    recently, or when offline mode is on (see web.set_offline)
+    """
+    return not web.is_offline(url)
 
-def check_internet():
-    """ Don't do internet stuf if no internet """
-    try:
-        request = requests.get("https://www.google.com/", timeout=5)
-        return True
-    except (requests.ConnectionError, requests.Timeout) as e:
+
+def blob_sha(path, chunk_size=1024**2) -> str:
+    """
+    Git's sha for a file's contents, same as listed in Github's trees api
+    """
+    h = sha1(f"blob {os.path.getsize(path)}\0".encode())
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_matches(path, info) -> bool:
+    """
+    Whether the file at path has the size and sha in info. The size is
+    checked first, so most changed files are caught without hashing them.
+    """
+    if not info or not os.path.exists(path):
         return False
+    if info.get('size') is not None and os.path.getsize(path) != info['size']:
+        return False
+    return info.get('sha') is not None and blob_sha(path) == info['sha']
+
+
+_inflight = {} # (source_id, name, cache key) -> Future of a download in progress. See inflight()
+_inflight_lock = threading.Lock()
+
+
+@contextmanager
+def inflight(key):
+    """
+    One download for concurrent loads of the same key, sync or async.
+    Yields (future, owner). The first caller owns the download, and sets
+    the future's result inside the block. An exception raised there goes
+    to everyone waiting. Callers that come in meanwhile get the same
+    future, and wait on it instead.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+    if not owner:
+        yield future, False
+        return
+    try:
+        yield future, True
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        if not future.done():
+            future.cancel() # Never leave waiters hanging
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def load_jobs(jobs:dict, save=True, max_workers=8, **kwargs) -> dict:
+    """
+    Runs Source.load for each {key: (source, name)}, names already
+    resolved: memory cache hits right away, the rest max_workers at a
+    time. Returns {key: df}, in the order of jobs.
+    """
+    results, misses = {}, {}
+    for key, (source, name) in jobs.items():
+        if source.has_cached(name, **kwargs):
+            results[key] = source.load(name, save, **kwargs)
+        else:
+            misses[key] = (source, name)
+
+    if misses:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {key: pool.submit(source.load, name, save, **kwargs) for key, (source, name) in misses.items()}
+            for key, future in futures.items():
+                results[key] = future.result()
+    return {key: results[key] for key in jobs}
+
+
+def build_index(names, full_paths) -> dict:
+    """
+    Lookup tables for a source's datasets: see Source.__index
+    """
+    index = {'full': {}, 'base': {}, 'dirs': {"": {'files': [], 'dirs': []}}}
+    dirs = index['dirs']
+    for name, full in zip(names, full_paths):
+        index['full'][full] = name
+        dir, _, base = name.rpartition('/')
+        index['base'].setdefault(base, []).append(name)
+
+        # Register dir, and each parent that isn't known yet
+        child = None
+        while dir not in dirs:
+            dirs[dir] = {'files': [], 'dirs': []}
+            if child is not None:
+                dirs[dir]['dirs'].append(child)
+            child, dir = dir, dir.rpartition('/')[0]
+        if child is not None:
+            dirs[dir]['dirs'].append(child)
+        dirs[name.rpartition('/')[0]]['files'].append(base)
+    return index
+
+
+def print_progress(report, total, seconds):
+    done = len(report['saved']) + len(report['skipped']) + len(report['failed'])
+    mb = report['bytes'] / 1024**2
+    print(f"\r{done}/{total} files  {mb:.1f} MB  {mb / max(seconds, 1e-9):.1f} MB/s  "
+          f"({len(report['skipped'])} up to date, {len(report['failed'])} failed)",
+          end="", flush=True)
 
 
 @dataclass
@@ -54,6 +166,18 @@ class Source:
     # is used only for validation purposes, to correct user mistakes
     # and make sure we build a valid url before loading data.
 
+    __files = {} # Git blob sha and size of each dataset, by name, as
+    # listed in the tree. Used to tell whether a local copy is current
+
+    __index = {} # Built once per refresh_datasets(), so that looking up
+    # a name, or listing a directory, never scans every dataset:
+    # {
+    #     'full': {full path: name},
+    #     'base': {base filename: [names]},
+    #     'dirs': {"dir/sub": {'files': [base filenames], 'dirs': ["dir/sub/x"]}}
+    # }
+    # 'dirs' has every directory at any depth. The root is "".
+
     cache = DFCache() # DFs cached after user loads them. See DFCache
 
     # Getters
@@ -88,15 +212,38 @@ class Source:
             self.refresh_datasets()
         return self.__datasets_full
 
+    @property
+    def files(self) -> dict:
+        """
+        {name: {'sha': git blob sha, 'size': bytes}} for each dataset
+        """
+        if self.__files == {}:
+            self.refresh_datasets()
+        return self.__files
+
+    @property
+    def has_datasets(self) -> bool:
+        """
+        Whether datasets are already loaded, without requesting them
+        """
+        return self.__datasets_full != []
+
     # Getters - calculated
+    @property
+    def index(self) -> dict:
+        """
+        Lookup tables for names and directories. See __index
+        """
+        if self.__index == {}:
+            self.refresh_datasets()
+        return self.__index
+
     @property
     def subdirs(self) -> list:
         """
         First layer of sub-directories in datasource.
         """
-        return list(set([
-                f.split('/')[0] for f in self.datasets if "/" in f
-            ]))
+        return self.subdirs_of("")
 
     @property
     def datasets_base(self) -> list:
@@ -105,6 +252,14 @@ class Source:
         """
         return [f.rsplit('/', 1)[-1] for f in self.datasets]
 
+    def subdirs_of(self, dir) -> list:
+        """ Sub-directories directly inside dir, by full path """
+        return self.index.get('dirs', {}).get(dir, {}).get('dirs', [])
+
+    def files_in(self, dir) -> list:
+        """ Base filenames of datasets directly inside dir """
+        return self.index.get('dirs', {}).get(dir, {}).get('files', [])
+
     @property
     def root(self) -> str:
         """
@@ -112,12 +267,19 @@ class Source:
         """
         return f"https://github.com/{self.user}/{self.repo}/tree/{self.branch}/{self.path}"
     
+    @property
+    def source_id(self) -> str:
+        """
+        Identifies this source in the disk cache
+        """
+        return f"{self.user}/{self.repo}/{self.branch}/{self.path}"
+
     @property
     def req_url(self) -> str:
         """
         Url to Github API for getting all files in repo and branch
         """
-        return f"https://api.github.com/repos/{self.user}/{self.repo}/git/trees/{self.branch}?recursive=1"
+        return web.api_url(f"repos/{self.user}/{self.repo}/git/trees/{self.branch}?recursive=1")
 
     # Setters - include validation logic
     @user.setter
@@ -143,9 +305,12 @@ class Source:
         if value.endswith("/"):
             raise ValueError("Path must not end with a slash")
         self.__path = value
-        # Update datasets since path changed, but only if we have valid data
-        if self.user != "" and self.repo != "" and self.branch != "":
-            self.refresh_datasets()
+        # Path changed, so datasets are out of date. They're requested
+        # again the next time they're accessed
+        self.__datasets = []
+        self.__datasets_full = []
+        self.__files = {}
+        self.__index = {}
 
 
     def file_url(self, filename) -> str:
@@ -153,22 +318,128 @@ class Source:
         Url to raw, downloadable file
         """
         path = f"{self.path}/" if len(self.path) > 0 else self.path
-        return f"https://raw.githubusercontent.com/{self.user}/{self.repo}/{self.branch}/{path}{filename}.csv"
+        return web.raw_url(f"{self.user}/{self.repo}/{self.branch}/{path}{filename}.csv")
 
 
-    def req_files(self) -> list:
-        """ Request files """
-        if check_internet():
-            return requests.get(self.req_url).json()
-        return None
+    @stats.timed('req_files')
+    def req_files(self, force=False) -> dict:
+        """
+        Request files. A listing cached within its ttl is used without
+        asking Github, unless force. An older one is revalidated with its
+        ETag, and still used if Github can't be reached.
+        """
+        cached, entry = self.cached_listing(force)
+        if cached:
+            return cached
+        try:
+            res = web.get_json(self.req_url)
+        except (requests.ConnectionError, requests.Timeout):
+            return {'tree': entry['tree']} if entry else None
+        return self.store_listing(res)
+
+
+    @stats.timed('req_files')
+    async def areq_files(self, force=False) -> dict:
+        """ Async req_files """
+        cached, entry = self.cached_listing(force)
+        if cached:
+            return cached
+        try:
+            res = await aweb.get_json(self.req_url)
+        except (requests.ConnectionError, requests.Timeout):
+            return {'tree': entry['tree']} if entry else None
+        return self.store_listing(res)
+
+
+    def cached_listing(self, force=False) -> tuple:
+        """
+        (listing, entry): listing is the cached listing if it's fresh
+        and not force, else None. entry is whatever the listing cache has,
+        primed for revalidation.
+        """
+        trees = treecache.tree_cache
+        entry = trees.get(self.user, self.repo, self.branch) if trees else None
+        if entry and not force and trees.fresh(entry):
+            return {'tree': entry['tree']}, entry
+        if entry:
+            body = json.dumps({'tree': entry['tree']}).encode()
+            web.prime(self.req_url, body, entry.get('etag'), entry.get('last_modified'))
+        return None, entry
+
+
+    def store_listing(self, res) -> dict:
+        """ Keep a listing from the trees api in the listing cache """
+        trees = treecache.tree_cache
+        if trees and isinstance(res, dict) and 'tree' in res:
+            trees.add(self.user, self.repo, self.branch, res['tree'], **web.validators(self.req_url))
+        return res
     
 
     def dir_contents(self, dir) -> list:
-        """ Get filenames in directory """
-        return [f.removeprefix(f"{dir}/") for f in self.datasets if f.startswith(dir)]
+        """ Get filenames in directory, and all its sub-directories """
+        contents = list(self.files_in(dir))
+        for sub in self.subdirs_of(dir):
+            prefix = sub.removeprefix(f"{dir}/")
+            contents += [f"{prefix}/{f}" for f in self.dir_contents(sub)]
+        return contents
+
+
+    def resolve(self, fname):
+        """
+        Name of the dataset fname refers to, or None if it matches no
+        dataset, or more than one. fname can be:
+        - The name, relative to the source's path
+        - The full path from the repository root
+        - Just the base filename, if no other directory has a file
+          with that name, at any depth
+        - The end of a path, if no other file's path ends the same way
+          ('sub/file' for 'data/sub/file'). The directories typed must
+          match: 'other/file' never loads 'data/sub/file'.
+        """
+        index = self.index
+        if fname in self.__files:
+            return fname
+        if fname in index.get('full', {}):
+            return index['full'][fname]
+        candidates = index.get('base', {}).get(fname.rsplit('/', 1)[-1], [])
+        if '/' in fname:
+            candidates = [name for name in candidates if name.endswith(f"/{fname}")]
+        if len(candidates) == 1:
+            return candidates[0]
+        return None
 
 
-    def load(self, fname, save=True, **kwargs) -> pd.DataFrame:
+    def lookup(self, fname) -> tuple:
+        """
+        (name, listed): the dataset fname refers to, and whether it was
+        checked against the file listing. It can't be while offline with
+        no listing cached, and fname is then taken as is.
+        """
+        if self.__datasets == [] and not check_internet(self.req_url):
+            # Can't request file structure, but there may be a cached listing
+            self.refresh_datasets()
+        if self.__datasets == [] and not check_internet(self.req_url):
+            return fname.removeprefix(f"{self.path}/"), False
+
+        # -------- IMPORTANT --------------
+        # THIS IF-ELSE BLOCK NEEDS TO MOVE TO DATASOURCE CLASS.
+        # THEN, DATASOURCE CLASS NEEDS A "LOAD()" FUNCTION
+        # ----------------------------------
+        # Validate dataset name exists, and modify as necessary
+        # This also validates that datasets are loaded and connection to GH works
+        name = self.resolve(fname)
+        if name is None:
+            raise ValueError(
+                "Either the file doesn't exist, or your query matched more than one file.\n"
+                "If the latter is true, make sure to use the full subpath.\n"
+                "Hint: Here's the url that would have been used, but it was detected as invalid:\n"
+                f"{self.file_url(fname)}"
+                )
+        return name, True
+
+
+    @stats.timed('load')
+    def load(self, fname, save=True, chunksize=None, transform=None, engine=None, compact=None, cache_key=None, **kwargs) -> pd.DataFrame:
         """
         Given a filename, return a dataframe!
         ---
@@ -183,105 +454,365 @@ class Source:
         - Add to cache only when save is true
         - If save is false, remove an existing cache if exists for
           that file, but only if dataframes match (same kwargs)
+        ---
+        Big files: pass chunksize and/or transform to read the file in
+        chunks as it downloads (see iter_chunks), and keep only what
+        transform(chunk) returns. A transformed df is only cached when
+        cache_key names it: nothing about a function reliably tells
+        whether it, or the data it reads, changed since. Otherwise it's
+        read afresh every time, and the cache isn't touched.
+        ---
+        engine: csv parser, 'c' or 'pyarrow' (default: see set_csv_engine).
+        Chunked loads always use 'c'.
+        ---
+        compact: shrink the df before caching it: True, False, or a dict
+        of options (default: see set_compaction, and compaction.compact)
         """
+        kwargs, cache_kwargs, compact = self.load_options(chunksize, transform, engine, compact, cache_key, **kwargs)
+
+        with stats.stage('lookup', file=fname):
+            name, listed = self.lookup(fname)
+        if cache_kwargs is None:
+            # Transformed, without a cache_key: never cached
+            if not listed:
+                raise web.OfflineError(f"Offline, and '{fname}' can't be downloaded")
+            with stats.stage('stream', file=name):
+                df = self.read_chunks(name, chunksize, transform, **kwargs)
+            return self.store(name, df, False, compact, {})
+        with stats.stage('cache_lookup', file=name):
+            df = self.load_cached(name, save, **cache_kwargs)
+        if df is not None:
+            return df
+        if not listed:
+            # Can't validate against file structure, so can't download
+            raise web.OfflineError(f"Offline, and '{fname}' isn't cached")
+
+        with inflight((self.source_id, name, kwargs_key(**cache_kwargs))) as (future, owner):
+            if not owner:
+                # The same file, with the same kwargs, is already downloading
+                return self.cache.copy(future.result())
+            # It may have been cached while we waited to own the download
+            df = self.load_cached(name, save, **cache_kwargs)
+            if df is None:
+                # Load new data, cache, and return
+                if chunksize or transform:
+                    with stats.stage('stream', file=name):
+                        df = self.read_chunks(name, chunksize, transform, **kwargs)
+                else:
+                    with stats.stage('download', file=name):
+                        body = web.get_bytes(self.file_url(name))
+                    with stats.stage('parse', file=name):
+                        df = pd.read_csv(io.BytesIO(body), **kwargs)
+                df = self.store(name, df, save, compact, cache_kwargs)
+            future.set_result(df)
+            return df
 
-        # -------- IMPORTANT --------------
-        # THIS IF-ELSE BLOCK NEEDS TO MOVE TO DATASOURCE CLASS.
-        # THEN, DATASOURCE CLASS NEEDS A "LOAD()" FUNCTION
-        # ----------------------------------
-        # Validate dataset name exists, and modify as necessary
-        # This also validates that datasets are loaded and connection to GH works
-        name = None
-        if countOf(self.datasets, fname) == 1:
-            name = fname
 
-        elif countOf(self.datasets, fname.split('/')[-1]) == 1:
-            name = fname.split('/')[-1]
+    @stats.timed('load')
+    async def aload(self, fname, save=True, chunksize=None, transform=None, engine=None, compact=None, cache_key=None, **kwargs) -> pd.DataFrame:
+        """
+        Async load(). The download doesn't block the event loop, and
+        everything else that can take a while (reading the disk cache,
+        parsing, compacting, caching, copying) runs in worker threads, so
+        many files can load at once. Shares the cache with load(). Chunked
+        loads (chunksize or transform) run load() in a worker thread.
+        """
+        if chunksize or transform:
+            return await asyncio.to_thread(self.load, fname, save, chunksize, transform, engine, compact, cache_key, **kwargs)
 
-        elif countOf(self.datasets_full, fname) == 1:
-            name = fname.removeprefix(f"{self.path}/")
+        kwargs, cache_kwargs, compact = self.load_options(None, None, engine, compact, **kwargs)
+
+        if not self.has_datasets and check_internet(self.req_url):
+            await self.arefresh_datasets()
+        with stats.stage('lookup', file=fname):
+            if self.has_datasets:
+                name, listed = self.lookup(fname)
+            else:
+                # Offline or failed: lookup may block, trying the listing cache
+                name, listed = await asyncio.to_thread(self.lookup, fname)
+        with stats.stage('cache_lookup', file=name):
+            df = await asyncio.to_thread(self.load_cached, name, save, **cache_kwargs)
+        if df is not None:
+            return df
+        if not listed:
+            raise web.OfflineError(f"Offline, and '{fname}' isn't cached")
+
+        with inflight((self.source_id, name, kwargs_key(**cache_kwargs))) as (future, owner):
+            if not owner:
+                return await asyncio.to_thread(self.cache.copy, await asyncio.wrap_future(future))
+            df = await asyncio.to_thread(self.load_cached, name, save, **cache_kwargs)
+            if df is None:
+                with stats.stage('download', file=name):
+                    body = await aweb.get_bytes(self.file_url(name))
+                with stats.stage('parse', file=name):
+                    df = await asyncio.to_thread(pd.read_csv, io.BytesIO(body), **kwargs)
+                df = await asyncio.to_thread(self.store, name, df, save, compact, cache_kwargs)
+            future.set_result(df)
+            return df
+
+
+    def load_many(self, names, save=True, max_workers=8, **kwargs) -> dict:
+        """
+        Loads several files. Names are all resolved first, so a bad one
+        fails before anything downloads. Cached files are served right
+        away, and the rest downloaded max_workers at a time. Asking for
+        the same file twice downloads it once.
+        - kwargs: same as load(), for every file
+        Returns {name: df}, in the order given
+        """
+        jobs = {fname: (self, self.lookup(fname)[0]) for fname in names}
+        return load_jobs(jobs, save, max_workers, **kwargs)
+
+
+    def has_cached(self, name, chunksize=None, transform=None, engine=None, compact=None, cache_key=None, **kwargs) -> bool:
+        """
+        Whether load(name, **kwargs) would be served from memory
+        """
+        _, cache_kwargs, _ = self.load_options(chunksize, transform, engine, compact, cache_key, **kwargs)
+        return cache_kwargs is not None and self.cache.find(name, **cache_kwargs) is not None
+
+
+    async def aload_many(self, names, max_concurrency=16, **kwargs) -> dict:
+        """
+        Async load of several files at once, at most max_concurrency at a
+        time. Returns {name: df}, in the order given.
+        """
+        limit = asyncio.Semaphore(max_concurrency)
+        if not self.has_datasets and check_internet(self.req_url):
+            await self.arefresh_datasets() # Once, rather than by every load
+
+        async def one(name):
+            async with limit:
+                return await self.aload(name, **kwargs)
+
+        dfs = await asyncio.gather(*(one(name) for name in names))
+        return dict(zip(names, dfs))
+
+
+    def load_options(self, chunksize, transform, engine, compact, cache_key=None, **kwargs) -> tuple:
+        """
+        (read_csv kwargs, cache kwargs, compaction settings) for a load.
+        Cache kwargs are None for a transform without a cache_key, which
+        isn't cached.
+        """
+        if not (chunksize or transform):
+            kwargs = parsing.read_kwargs(engine, **kwargs)
+        compact = compaction.resolve(compact)
+        if transform and cache_key is None:
+            return kwargs, None, compact
+        # The transform and compaction change the result, so they're part of the cache key
+        cache_kwargs = dict(kwargs)
+        if transform:
+            cache_kwargs['transform'] = str(cache_key)
+        if compact:
+            cache_kwargs['compact'] = compaction.settings_key(compact)
+        return kwargs, cache_kwargs, compact
+
+
+    def store(self, name, df, save, compact, cache_kwargs) -> pd.DataFrame:
+        """
+        Compact a freshly loaded df, cache it if save, and return it
+        """
+        if compact:
+            with stats.stage('compact', file=name):
+                before = int(df.memory_usage(deep=True).sum())
+                df = compaction.compact(df, **compact)
+                after = int(df.memory_usage(deep=True).sum())
+            compaction.report[f"{self.user}/{self.repo}/{name}"] = {'before': before, 'after': after, 'saved': before - after}
+        sha = self.file_sha(name)
+        disk = self.cache.disk
+        if save and disk:
+            with stats.stage('disk_add', file=name):
+                disk.add(self.source_id, name, df, kwargs_key(**cache_kwargs), sha=sha)
+
+        if save:
+            with stats.stage('cache_add', file=name):
+                added = self.cache.add(name, df, sha=sha, **cache_kwargs)
+            if added:
+                return self.cache.copy(df)
+
+        return df
+
+
+    def read_chunks(self, name, chunksize, transform, **kwargs) -> pd.DataFrame:
+        """ The whole df, from iter_chunks """
+        chunks = list(self.iter_chunks(name, chunksize or CHUNKSIZE, transform, **kwargs))
+        return pd.concat(chunks) if chunks else pd.DataFrame()
 
-        else:
-            raise ValueError(
-                "Either the file doesn't exist, or your query matched more than one file.\n"
-                "If the latter is true, make sure to use the full subpath.\n"
-                "Hint: Here's the url that would have been used, but it was detected as invalid:\n"
-                f"{self.file_url(fname)}"
-                )
+
+    def iter_chunks(self, fname, chunksize=CHUNKSIZE, transform=None, **kwargs):
+        """
+        Yields the file as dataframes of up to chunksize rows, parsed as
+        the download arrives, so the whole file is never in memory at once.
+        ---
+        - transform: optional function applied to each chunk, to filter
+          or reduce it. Chunks it returns None for are skipped.
+        - kwargs: for pd.read_csv
+        If the file is already cached with the same kwargs, chunks are
+        sliced from the cached df instead. Nothing is added to the cache:
+        use load(chunksize=...) for that.
+        """
+        name, _ = self.lookup(fname)
+
+        def apply(chunks):
+            for chunk in chunks:
+                if transform is not None:
+                    chunk = transform(chunk)
+                if chunk is not None:
+                    yield chunk
+
+        if self.cache.find(name, **kwargs) is not None:
+            df = self.cache.get(name, **kwargs)
+            yield from apply(df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+            return
+
+        with web.stream(self.file_url(name)) as res:
+            try:
+                with pd.read_csv(res.raw, chunksize=chunksize, **kwargs) as reader:
+                    yield from apply(reader)
+            finally:
+                stats.count('web.bytes', res.raw.tell(), url=res.url)
+
+
+    def load_cached(self, name, save=True, **kwargs):
+        """
+        Look for a dataset in memory, then on disk. None if in neither.
+        Cached versions of a file that has changed since are dropped.
+        """
+        sha = self.file_sha(name)
+        self.cache.expire(name, sha)
 
         # Cache
         if self.cache.df_matches(name, **kwargs):
-            df = self.cache.get(name)
+            df = self.cache.get(name, **kwargs)
             if not save:
                 # Pop existing cache for that version of the data if exists
-                self.cache.pop(name)
+                self.cache.pop(name, **kwargs)
             return df
 
-        # Load new data, cache, and return
-        df = pd.read_csv(self.file_url(name), **kwargs)
-        if save:
-            self.cache.add(fname, df, **kwargs)
+        # Disk cache, if enabled
+        disk = self.cache.disk
+        df = disk.get(self.source_id, name, kwargs_key(**kwargs), sha=sha) if disk else None
+        if df is None:
+            return None
 
-        return self.cache.get(name)
+        if save and self.cache.add(name, df, sha=sha, **kwargs):
+            return self.cache.copy(df)
+        return df
         
 
-    def save_all(self, dir="", **kwargs):
-        # Make directory for custom path
-        if dir != "":
-            p = ""
-            for d in dir.split("/"):
-                if p != "":
-                    p = f"{p}/{d}"
-                else:
-                    p = d
-                if not os.path.exists(p):
-                    os.mkdir(p)
-
-        # Make directories for all sub-paths
-        for name in self.datasets:
-            fullpath = name.split("/")
-            if dir != "":
-                fullpath = [dir] + fullpath
-            p = None
-            if len(fullpath) > 1:
-                path = fullpath[:-1]
-                p = ""
-                for d in path:
-                    if p != "":
-                        p = f"{p}/{d}"
-                    else:
-                        p = d
-                    if not os.path.exists(p):
-                        os.mkdir(p)
-
-        # Save datasets.
-        for name in self.datasets:
+    def save_all(self, dir="", max_workers=8, progress=True, **kwargs) -> dict:
+        """
+        Writes every dataset to '{dir}/{name}.csv', preserving the
+        source's file structure. Files are downloaded max_workers at a time.
+        ---
+        - No kwargs: raw csv bytes are streamed straight to disk, without
+          going through pandas. Files already there, with the same size and
+          git blob sha as in the repository, are skipped, so an interrupted
+          save_all picks up where it left off.
+        - With kwargs: each file is loaded with pd.read_csv(**kwargs), and
+          the resulting df written back to csv. Nothing is skipped.
+        - progress: print files done, bytes written and throughput
+        Returns {'saved', 'skipped', 'failed', 'bytes', 'seconds'}
+        """
+        files = self.files if not kwargs else {}
+        paths = {name: os.path.join(dir, f"{name}.csv") for name in self.datasets}
+        for path in paths.values():
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        def save(name) -> tuple:
+            """ (bytes written, whether it was skipped) """
+            path = paths[name]
+            if not kwargs:
+                if file_matches(path, files.get(name)):
+                    return os.path.getsize(path), True
+                return web.download(self.file_url(name), path), False
+
             # Pass save argument false if it's not already cached,
             # because we don't want to cache everything. But if it is
             # cached, overwrite it with the new kwargs
-            save = False if not self.cache.has_key(name) else True
+            save = self.cache.has_key(name)
             df = self.load(name, save=save, **kwargs)
-            if dir != "":
-                df.to_csv(f"{dir}/{name}.csv", **kwargs)
+            # Write the index only when it holds data (index_col=...)
+            df.to_csv(path, index=not isinstance(df.index, pd.RangeIndex))
+            return os.path.getsize(path), False
+
+        report = {'saved': [], 'skipped': [], 'failed': {}, 'bytes': 0, 'seconds': 0}
+        lock = threading.Lock()
+        start = time.perf_counter()
+
+        def run(name):
+            try:
+                size, skipped = save(name)
+            except Exception as e:
+                with lock:
+                    report['failed'][name] = e
             else:
-                df.to_csv(f"{name}.csv", **kwargs)
+                with lock:
+                    report['skipped' if skipped else 'saved'].append(name)
+                    if not skipped:
+                        report['bytes'] += size
+            if progress:
+                with lock:
+                    print_progress(report, len(paths), time.perf_counter() - start)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(run, paths))
+
+        report['seconds'] = time.perf_counter() - start
+        if progress:
+            print()
+            for name, e in report['failed'].items():
+                print(f"Failed to save '{name}': {e}")
+        return report
         
 
-    def refresh_datasets(self):
-        res = self.req_files()
+    def file_sha(self, name):
+        """
+        Git blob sha of a dataset, if the file listing is loaded. Never
+        requests it.
+        """
+        return self.__files.get(name, {}).get('sha')
+
+
+    @stats.timed('refresh_datasets')
+    def refresh_datasets(self, force=False):
+        """
+        (Re)load the file listing. Served from the listing cache when it's
+        fresh, unless force (see req_files)
+        """
+        self.set_listing(self.req_files(force))
+
+
+    @stats.timed('refresh_datasets')
+    async def arefresh_datasets(self, force=False):
+        """ Async refresh_datasets """
+        self.set_listing(await self.areq_files(force))
+
+
+    def set_listing(self, res):
+        """ Datasets, file info and index from a trees api response """
         if not res:
             return []
 
         if res.get("message") == "Not Found":
             raise ValueError("No files found. Likely an invalid data source")
 
-        full_paths = [f['path'].removesuffix('.csv')
-                        for f in res['tree'] if ".csv" in f['path']]
+        entries = [f for f in res['tree'] if ".csv" in f['path']]
+        full_paths = [f['path'].removesuffix('.csv') for f in entries]
         
         self.__datasets_full = full_paths
         
         self.__datasets = [f.removeprefix(f"{self.path}/") for f in full_paths]
 
+        self.__files = {
+            name: {'sha': f.get('sha'), 'size': f.get('size')}
+            for name, f in zip(self.__datasets, entries)
+        }
+
+        self.__index = build_index(self.__datasets, full_paths)
+
 
 
 
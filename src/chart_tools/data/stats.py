@@ -0,0 +1,111 @@
+"""
+Timings and counters for the data loading hot paths, so it's possible
+to tell where the time in a load_data() call goes.
+---
+Stages (timed with stage() or @timed):
+    load, lookup, cache_lookup, download, parse, stream (download and
+    parse of a chunked load), compact, cache_add, disk_add,
+    refresh_datasets, req_files, request_branch
+Counters (with count()):
+    web.requests, web.bytes, web.not_modified, cache.hits,
+    cache.misses, cache.evictions, cache.copy_bytes
+---
+get_stats() returns everything recorded so far. Hooks added with
+add_hook(fn) are called with an event dict for each timing and count,
+to forward them to a metrics system:
+    {'type': 'timing', 'name': 'download', 'seconds': 0.12, ...}
+    {'type': 'count', 'name': 'web.bytes', 'value': 4096, ...}
+Extra keys ('file', 'url') depend on the stage.
+"""
+
+import time
+import inspect
+import threading
+import functools
+from contextlib import contextmanager
+
+_timings = {} # stage -> {'count', 'total', 'max'} seconds
+_counters = {} # name -> int
+_hooks = []
+_lock = threading.Lock()
+
+
+def add_hook(fn):
+    """ Call fn(event) for every timing and count """
+    _hooks.append(fn)
+
+
+def remove_hook(fn):
+    if fn in _hooks:
+        _hooks.remove(fn)
+
+
+def emit(event):
+    for fn in list(_hooks):
+        try:
+            fn(event)
+        except Exception:
+            pass # A broken hook must never break loading data
+
+
+def record(name, seconds, **info):
+    with _lock:
+        t = _timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        t['count'] += 1
+        t['total'] += seconds
+        t['max'] = max(t['max'], seconds)
+    if _hooks:
+        emit({'type': 'timing', 'name': name, 'seconds': seconds, **info})
+
+
+def count(name, value=1, **info):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    if _hooks:
+        emit({'type': 'count', 'name': name, 'value': value, **info})
+
+
+@contextmanager
+def stage(name, **info):
+    """ Time the block as stage 'name' """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, **info)
+
+
+def timed(name):
+    """ Decorator: time each call as stage 'name'. Works on async functions too """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_stats() -> dict:
+    """
+    {'timings': {stage: {'count', 'total', 'max', 'mean'}}, 'counters': {name: value}}
+    """
+    with _lock:
+        timings = {
+            k: {**v, 'mean': v['total'] / v['count'] if v['count'] else 0.0}
+            for k, v in _timings.items()
+        }
+        return {'timings': timings, 'counters': dict(_counters)}
+
+
+def reset_stats():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import threading
+from hashlib import md5
+
+TREE_TTL = 3600 # Seconds a cached listing is used without asking Github
+
+DEFAULT_DIR = os.path.join(
+        os.environ.get("CHART_TOOLS_CACHE_DIR")
+        or os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "chart-tools"),
+        "trees",
+        )
+
+
+class TreeCache:
+    """
+    Keeps the csv file listing of each repository branch on disk, so a
+    new Source, or a restarted kernel, doesn't ask Github's trees api
+    for it again.
+    ---
+    One json file per (user, repo, branch):
+    {
+        "fetched": <time.time() when Github was last asked>,
+        "etag": "...",
+        "last_modified": "...",
+        "tree": [
+            {"path": "data/some-file.csv", "sha": "<git blob sha>", "size": 1234},
+            . . .
+        ]
+    }
+    ---
+    For ttl seconds after it was fetched, a listing is used as is. After
+    that, Github is asked again with its ETag, and an unchanged listing
+    costs a '304 Not Modified', which doesn't count against the api's
+    rate limit. Per-file sha and size let the dataframe caches tell
+    when a cached file has changed (see DFCache.expire).
+    ---
+    Library json files are kept the same way, under the same ttl, one
+    'library-<md5 of url>.json' per url, with the library in "data"
+    instead of "tree". So a library loads offline after a restart too.
+    """
+
+    def __init__(self, dir=DEFAULT_DIR, ttl=TREE_TTL):
+        self.dir = dir
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+    def path(self, user, repo, branch) -> str:
+        key = md5(f"{user}/{repo}/{branch}".encode()).hexdigest()
+        return os.path.join(self.dir, f"{key}.json")
+
+    def get(self, user, repo, branch):
+        """ Cached listing, fresh or not. None if there isn't one """
+        try:
+            with open(self.path(user, repo, branch)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def fresh(self, entry) -> bool:
+        return entry is not None and time.time() - entry.get('fetched', 0) < self.ttl
+
+    def add(self, user, repo, branch, tree, etag=None, last_modified=None):
+        entry = {
+            'fetched': time.time(),
+            'etag': etag,
+            'last_modified': last_modified,
+            'tree': [
+                {'path': f['path'], 'sha': f.get('sha'), 'size': f.get('size')}
+                for f in tree if ".csv" in f['path']
+            ],
+        }
+        self.write(self.path(user, repo, branch), entry)
+
+    def library_path(self, url) -> str:
+        return os.path.join(self.dir, f"library-{md5(url.encode()).hexdigest()}.json")
+
+    def get_library(self, url):
+        """ Cached library json, fresh or not. None if there isn't one """
+        try:
+            with open(self.library_path(url)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def add_library(self, url, data:dict, etag=None, last_modified=None):
+        entry = {'fetched': time.time(), 'etag': etag, 'last_modified': last_modified, 'data': data}
+        self.write(self.library_path(url), entry)
+
+    def write(self, path, entry:dict):
+        try:
+            with self.lock:
+                os.makedirs(self.dir, exist_ok=True)
+                # Write to a temp file first, so a crash never leaves half a file
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump(entry, f)
+                os.replace(tmp, path)
+        except OSError:
+            pass # Read-only or full disk: just don't cache
+
+    def clear(self):
+        with self.lock:
+            if not os.path.isdir(self.dir):
+                return
+            for file in os.listdir(self.dir):
+                if file.endswith(".json"):
+                    os.remove(os.path.join(self.dir, file))
+
+
+tree_cache = TreeCache()
+
+
+def set_tree_cache(dir=DEFAULT_DIR, ttl=TREE_TTL):
+    """
+    Where listings of repository files are cached, and for how many
+    seconds they're used before checking Github again. Pass dir=None
+    to turn the listing cache off.
+    """
+    global tree_cache
+    tree_cache = TreeCache(dir, ttl) if dir else None
@@ -0,0 +1,268 @@
+"""
+All network traffic to Github goes through one pooled requests.Session,
+so connections are kept alive and reused across calls, and failed
+requests are retried with backoff.
+---
+Api and json responses with an ETag or Last-Modified header are
+remembered (up to ETAG_MAX_BYTES in total). Asking for the same url
+again sends If-None-Match / If-Modified-Since, and a '304 Not Modified'
+reply is answered from memory, without downloading the body again.
+Csv files aren't: their dataframes are cached already (see DFCache).
+---
+When a request fails to connect, its host is marked offline for OFFLINE_TTL
+seconds, and further requests to it fail straight away instead of each waiting
+for a timeout. A host that connects but is slow to send data (one big file,
+say) isn't. set_offline() forces offline mode, so everything is
+served from local caches only.
+---
+Base urls can be changed with set_base_urls(), or the CHART_TOOLS_API_URL
+and CHART_TOOLS_RAW_URL environment variables, to point at a local
+stand-in server.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import ReadTimeoutError
+
+from chart_tools.data import stats
+
+API_URL = os.environ.get("CHART_TOOLS_API_URL", "https://api.github.com")
+RAW_URL = os.environ.get("CHART_TOOLS_RAW_URL", "https://raw.githubusercontent.com")
+
+TIMEOUT = (5, 30) # Seconds to connect, and to wait for data
+ETAG_MAX_BYTES = 64 * 1024**2 # Total size of response bodies kept for conditional requests
+
+OFFLINE_TTL = 30 # Seconds to stay offline after a failed connection
+_offline_until = {} # host -> time.monotonic() until which it's considered offline
+_offline_forced = False
+
+_etags = OrderedDict() # url -> {'etag', 'last_modified', 'body'}
+_lock = threading.Lock()
+
+
+def new_session(retries=3, backoff=0.5, pool_size=16) -> requests.Session:
+    session = requests.Session()
+    retry = Retry(
+            total=retries,
+            connect=1, # Don't keep knocking on a host that isn't there
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET", "HEAD"),
+            )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+session = new_session()
+
+
+class OfflineError(requests.ConnectionError):
+    """ Raised instead of making a request while offline """
+
+
+def set_offline(offline=True):
+    """
+    Force offline mode: no network requests are made, and data is only
+    served from the memory and disk caches. set_offline(False) to undo.
+    """
+    global _offline_forced
+    _offline_forced = offline
+    _offline_until.clear()
+
+
+def is_offline(url=None) -> bool:
+    """
+    Whether requests to url's host (by default, the raw file server)
+    would be skipped as offline
+    """
+    host = urlsplit(url or RAW_URL).netloc
+    return _offline_forced or time.monotonic() < _offline_until.get(host, 0)
+
+
+def set_base_urls(api=None, raw=None):
+    """
+    Change where Github's api and raw file server are found.
+    None leaves a url as is.
+    """
+    global API_URL, RAW_URL
+    if api:
+        API_URL = api.rstrip("/")
+    if raw:
+        RAW_URL = raw.rstrip("/")
+
+
+def api_url(path) -> str:
+    return f"{API_URL}/{path.lstrip('/')}"
+
+
+def raw_url(path) -> str:
+    return f"{RAW_URL}/{path.lstrip('/')}"
+
+
+def rememberable(url) -> bool:
+    """ Whether url's body is kept for conditional requests: api and json only """
+    return url.startswith(API_URL) or urlsplit(url).path.endswith(".json")
+
+
+def remember(url, res):
+    """ Keep a response body, if it can be revalidated later """
+    etag, modified = res.headers.get("ETag"), res.headers.get("Last-Modified")
+    if not (etag or modified) or not rememberable(url) or len(res.content) > ETAG_MAX_BYTES:
+        return
+    with _lock:
+        _etags[url] = {'etag': etag, 'last_modified': modified, 'body': res.content}
+        _etags.move_to_end(url)
+        total = sum(len(v['body']) for v in _etags.values())
+        while total > ETAG_MAX_BYTES:
+            total -= len(_etags.popitem(last=False)[1]['body'])
+
+
+def prime(url, body, etag=None, last_modified=None):
+    """
+    Remember a body kept elsewhere (on disk, say) under its validators,
+    so the next request for url is conditional
+    """
+    if not (etag or last_modified):
+        return
+    with _lock:
+        _etags[url] = {'etag': etag, 'last_modified': last_modified, 'body': body}
+
+
+def validators(url) -> dict:
+    """ {'etag', 'last_modified'} remembered for url, if any """
+    known = _etags.get(url) or {}
+    return {'etag': known.get('etag'), 'last_modified': known.get('last_modified')}
+
+
+def conditional_headers(url) -> tuple:
+    """
+    (headers, remembered copy) for a request that revalidates what's
+    remembered for url, if anything
+    """
+    headers = {}
+    known = _etags.get(url)
+    if known:
+        if known['etag']:
+            headers["If-None-Match"] = known['etag']
+        if known['last_modified']:
+            headers["If-Modified-Since"] = known['last_modified']
+    return headers, known
+
+
+def mark_offline(url):
+    """ Skip requests to url's host for OFFLINE_TTL seconds """
+    _offline_until[urlsplit(url).netloc] = time.monotonic() + OFFLINE_TTL
+
+
+def failed_to_connect(e:requests.RequestException) -> bool:
+    """
+    Whether e means the host couldn't be reached, rather than that it
+    was slow to send data. Read timeouts come as Timeout, or, once
+    retries run out, as a ConnectionError wrapping a ReadTimeoutError.
+    """
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    if isinstance(e, requests.Timeout) or not isinstance(e, requests.ConnectionError):
+        return False
+    reason = e.args[0] if e.args else None
+    return not isinstance(getattr(reason, 'reason', reason), ReadTimeoutError)
+
+
+def handle_response(url, res, known) -> tuple:
+    """
+    (status code, body bytes) for a response to a conditional request.
+    res can be a requests or an httpx response.
+    """
+    stats.count('web.requests', url=url)
+    if res.status_code == 304 and known:
+        stats.count('web.not_modified', url=url)
+        with _lock:
+            if url in _etags:
+                _etags.move_to_end(url)
+        return 200, known['body']
+
+    stats.count('web.bytes', len(res.content), url=url)
+
+    if 200 <= res.status_code < 400:
+        remember(url, res)
+    return res.status_code, res.content
+
+
+def get_content(url, timeout=TIMEOUT) -> tuple:
+    """
+    GET url through the shared session, revalidating a remembered copy
+    if there is one. Returns (status code, body bytes).
+    A 304 comes back as (200, remembered body).
+    """
+    headers, known = conditional_headers(url)
+    if is_offline(url):
+        raise OfflineError(f"Offline, not requesting {url}")
+    try:
+        res = session.get(url, headers=headers, timeout=timeout)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        if failed_to_connect(e):
+            mark_offline(url)
+        raise
+    return handle_response(url, res, known)
+
+
+def stream(url, timeout=TIMEOUT) -> requests.Response:
+    """
+    GET url without reading its body yet. Use as a context manager, and
+    read res.raw (already decompressed) as a file, or iterate over
+    res.iter_content(). Raises for error status codes.
+    """
+    if is_offline(url):
+        raise OfflineError(f"Offline, not requesting {url}")
+    try:
+        res = session.get(url, timeout=timeout, stream=True)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        if failed_to_connect(e):
+            mark_offline(url)
+        raise
+    stats.count('web.requests', url=url)
+    if not res.ok:
+        res.close()
+        res.raise_for_status()
+    res.raw.decode_content = True
+    return res
+
+
+def download(url, path, timeout=TIMEOUT, chunk_size=1024**2) -> int:
+    """
+    Streams url's body straight to a file, without holding it in memory.
+    Written to a temp file first, so an interrupted download never leaves
+    half a file at path. Returns the number of bytes written.
+    """
+    with stream(url, timeout) as res:
+        size = 0
+        tmp = f"{path}.part"
+        with open(tmp, "wb") as f:
+            for chunk in res.iter_content(chunk_size):
+                f.write(chunk)
+                size += len(chunk)
+    os.replace(tmp, path)
+    stats.count('web.bytes', size, url=url)
+    return size
+
+
+def get_json(url, timeout=TIMEOUT):
+    status, body = get_content(url, timeout)
+    return json.loads(body)
+
+
+def get_bytes(url, timeout=TIMEOUT) -> bytes:
+    """ Body of url. Raises for error status codes """
+    status, body = get_content(url, timeout)
+    if status >= 400:
+        raise requests.HTTPError(f"{status} error for url: {url}")
+    return body
@@ -0,0 +1,145 @@
+import os
+import math
+import matplotlib as mpl
+import seaborn as sns
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from concurrent.futures import ProcessPoolExecutor
+
+from chart_tools.heatmaps.superheat import (
+        prepare_superheat,
+        draw_superheat,
+        draw_colorbar,
+        )
+
+# Keyword arguments that belong to the data stage, rather than drawing
+PREPARE_ARGS = ('thresh_avg', 'thresh_mask', 'half_mask', 'self_mask', 'drop_zeros', 'top_k', 'top_pairs', 'cache')
+
+
+def style_rc(style='darkgrid', font_scale=1, rc=None) -> dict:
+    """
+    rcParams for a seaborn theme, built without calling sns.set(),
+    so global matplotlib state is never changed.
+    """
+    params = {**sns.axes_style(style), **sns.plotting_context('notebook', font_scale=font_scale)}
+    params.update(rc or {})
+    return params
+
+
+def split_kwargs(kwargs) -> tuple:
+    """ Split superheat kwargs into (data stage, drawing) kwargs """
+    prep = {k: v for k, v in kwargs.items() if k in PREPARE_ARGS}
+    draw = {k: v for k, v in kwargs.items() if k not in PREPARE_ARGS}
+    return prep, draw
+
+
+def superheat_grid(
+        corrs:dict,
+        ncols=3,
+        size=8,
+        cbar=True,
+        palette=None,
+        n_colors=128,
+        bar_ticks=5,
+        style='darkgrid',
+        font_scale=1,
+        rc=None,
+        **kwargs
+    ):
+    """
+    Draws many correlation dfs into one figure: one subplot per matrix,
+    titled by its key in corrs, with a single color bar shared by all.
+    ---
+    - size: width and height of each subplot, in inches
+    - style, font_scale, rc: seaborn theme for this figure only.
+      Global rcParams are left untouched.
+    - kwargs: same as superheat()
+    Returns (fig, {name: ax})
+    """
+    prep_kwargs, draw_kwargs = split_kwargs(kwargs)
+    draw_kwargs.pop('title', None) # Each subplot is titled by its name
+    nrows = math.ceil(len(corrs) / ncols)
+    ncols = min(ncols, len(corrs))
+
+    with mpl.rc_context(style_rc(style, font_scale, rc)):
+        fig = Figure(figsize=(size * ncols + (size / 10 if cbar else 0), size * nrows))
+        FigureCanvasAgg(fig)
+        grid = fig.add_gridspec(nrows, ncols * 30 + (1 if cbar else 0), hspace=0.4, wspace=0.1)
+
+        axes = {}
+        for i, (name, corr) in enumerate(corrs.items()):
+            row, col = divmod(i, ncols)
+            ax = fig.add_subplot(grid[row, col * 30:(col + 1) * 30 - 1])
+            data = prepare_superheat(corr, **prep_kwargs, scatter_kwargs=draw_kwargs)
+            draw_superheat(ax, data, title=name, palette=palette, n_colors=n_colors, **draw_kwargs)
+            axes[name] = ax
+
+        if cbar:
+            draw_colorbar(fig.add_subplot(grid[:, -1]), palette, n_colors, bar_ticks)
+
+    return fig, axes
+
+
+def render_file(name, corr, path, size, cbar, style, font_scale, rc, savefig_kwargs, kwargs) -> str:
+    """
+    Draws one superheat straight to a file, without pyplot.
+    Module-level so it can run in a worker process.
+    """
+    prep_kwargs, draw_kwargs = split_kwargs(kwargs)
+    palette = draw_kwargs.get('palette')
+    n_colors = draw_kwargs.get('n_colors', 128)
+    bar_ticks = draw_kwargs.pop('bar_ticks', 5)
+    draw_kwargs.setdefault('title', name)
+
+    with mpl.rc_context(style_rc(style, font_scale, rc)):
+        fig = Figure(figsize=(size, size))
+        FigureCanvasAgg(fig)
+        grid = fig.add_gridspec(1, 30, hspace=0.2, wspace=0.1)
+        ax = fig.add_subplot(grid[:, :-1])
+        data = prepare_superheat(corr, **prep_kwargs, scatter_kwargs=draw_kwargs)
+        draw_superheat(ax, data, **draw_kwargs)
+        if cbar:
+            draw_colorbar(fig.add_subplot(grid[:, -1]), palette, n_colors, bar_ticks)
+        fig.savefig(path, **savefig_kwargs)
+    return path
+
+
+def superheat_files(
+        corrs:dict,
+        dir="",
+        fmt='png',
+        n_jobs=None,
+        size=12,
+        cbar=True,
+        style='darkgrid',
+        font_scale=1.5,
+        rc=None,
+        savefig_kwargs=None,
+        **kwargs
+    ) -> dict:
+    """
+    Saves one superheat per correlation df, to '{dir}/{name}.{fmt}'.
+    ---
+    Figures are drawn on the Agg canvas without pyplot, and the seaborn
+    theme is applied per figure, so global state is never touched. That
+    makes it safe to spread the work over n_jobs worker processes.
+    None draws everything in this process.
+    - kwargs: same as superheat()
+    Returns {name: path}
+    """
+    if dir != "" and not os.path.exists(dir):
+        os.makedirs(dir)
+    savefig_kwargs = savefig_kwargs or {}
+
+    jobs = {
+        name: (name, corr, os.path.join(dir, f"{name}.{fmt}"), size, cbar,
+               style, font_scale, rc, savefig_kwargs, kwargs)
+        for name, corr in corrs.items()
+    }
+
+    if not n_jobs:
+        return {name: render_file(*args) for name, args in jobs.items()}
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        futures = {name: pool.submit(render_file, *args) for name, args in jobs.items()}
+        return {name: f.result() for name, f in futures.items()}
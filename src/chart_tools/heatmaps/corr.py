@@ -0,0 +1,115 @@
+import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+def chunk_sums(x:np.ndarray, shift:np.ndarray) -> tuple:
+    """
+    Pairwise sums for one chunk of rows, used to build a correlation
+    matrix that skips missing values the same way df.corr() does.
+    ---
+    For each pair of columns (i, j), only rows where both are present count.
+    Returns (n, sx, sxx, sxy), all (p, p):
+        n[i, j]   - number of rows where i and j are both present
+        sx[i, j]  - sum of x_i over those rows
+        sxx[i, j] - sum of x_i^2 over those rows
+        sxy[i, j] - sum of x_i * x_j over those rows
+    Data is shifted by a value near each column's mean first, which keeps
+    the raw sums from losing precision.
+    """
+    x = x - shift.astype(x.dtype)
+    valid = ~np.isnan(x)
+    if valid.all():
+        n = np.full((x.shape[1], x.shape[1]), float(len(x)))
+        sx = np.broadcast_to(x.sum(axis=0, dtype=np.float64)[:, None], n.shape)
+        sxx = np.broadcast_to((x * x).sum(axis=0, dtype=np.float64)[:, None], n.shape)
+        return n, sx, sxx, (x.T @ x).astype(np.float64)
+
+    w = valid.astype(x.dtype)
+    x = np.where(valid, x, 0)
+    n = (w.T @ w).astype(np.float64)
+    sx = (x.T @ w).astype(np.float64)
+    sxx = ((x * x).T @ w).astype(np.float64)
+    sxy = (x.T @ x).astype(np.float64)
+    return n, sx, sxx, sxy
+
+
+def rank_columns(df:pd.DataFrame, dtype=np.float64, chunksize=64) -> np.ndarray:
+    """
+    Average ranks of each column, ranked a few columns at a time
+    into one preallocated array. Missing values stay missing.
+    """
+    ranks = np.empty(df.shape, dtype=dtype)
+    for start in range(0, df.shape[1], chunksize):
+        stop = start + chunksize
+        ranks[:, start:stop] = df.iloc[:, start:stop].rank().to_numpy(dtype=dtype)
+    return ranks
+
+
+def corr_chunked(
+        df:pd.DataFrame,
+        method='pearson',
+        chunksize=100_000,
+        dtype=np.float64,
+        n_jobs=None,
+        min_periods=1,
+    ) -> pd.DataFrame:
+    """
+    Same result as df.corr(numeric_only=True), computed from streaming sums
+    over chunks of rows, so only one chunk is ever copied at a time.
+    ---
+    - method: 'pearson' or 'spearman'. Spearman needs every value in a
+      column to rank it, so ranks are built first (one column block at a
+      time, in dtype), then correlated in chunks. With missing values,
+      each column is ranked on its own, not once per pair like pandas does.
+    - dtype: np.float32 halves the memory of each chunk. Sums are still
+      accumulated in float64.
+    - n_jobs: number of threads to process chunks with. None runs serially.
+    """
+    df = df.select_dtypes(include=['number', 'bool'])
+    columns = df.columns
+
+    if method == 'pearson':
+        def chunk(start):
+            return df.iloc[start:start + chunksize].to_numpy(dtype=dtype, na_value=np.nan)
+    elif method == 'spearman':
+        ranks = rank_columns(df, dtype)
+        def chunk(start):
+            return ranks[start:start + chunksize]
+    else:
+        raise ValueError(f"Unknown method, '{method}'. Use 'pearson' or 'spearman'")
+
+    starts = range(0, len(df), chunksize)
+    if len(starts) == 0:
+        return pd.DataFrame(np.nan, index=columns, columns=columns)
+
+    # Shift each column by its first present value. Constant columns
+    # then sum to exactly 0 variance, and come out as NaN like in pandas
+    first = chunk(0)
+    shift = np.nan_to_num(first[np.argmax(~np.isnan(first), axis=0), np.arange(first.shape[1])])
+
+    def sums(start):
+        return chunk_sums(chunk(start), shift)
+
+    n = sx = sxx = sxy = 0
+    if n_jobs:
+        # numpy releases the GIL for matrix products, so threads run in parallel.
+        # Submit n_jobs chunks at a time to keep memory bounded.
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            for i in range(0, len(starts), n_jobs):
+                for res in pool.map(sums, starts[i:i + n_jobs]):
+                    n, sx, sxx, sxy = (a + b for a, b in zip((n, sx, sxx, sxy), res))
+    else:
+        for start in starts:
+            res = sums(start)
+            n, sx, sxx, sxy = (a + b for a, b in zip((n, sx, sxx, sxy), res))
+
+    # sx.T[i, j] is the sum of x_j over rows where i and j are both present
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * sxy - sx * sx.T
+        var = n * sxx - sx * sx
+        corr = cov / np.sqrt(var * var.T)
+    corr = np.clip(corr, -1, 1)
+    corr[n < max(min_periods, 2)] = np.nan
+
+    return pd.DataFrame(corr, index=columns, columns=columns)
@@ -2,48 +2,84 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
+from matplotlib.colors import to_rgba_array, ListedColormap, BoundaryNorm
+from dataclasses import dataclass
+from collections import OrderedDict
+from hashlib import blake2b
 
+from chart_tools.heatmaps.corr import corr_chunked
 
-def sig_corr(corr:pd.DataFrame, threshold:float) -> pd.DataFrame:
-    df = corr.copy()
-    df['mean'] = df.mean(axis=1)
-    to_drop = set()
-    for var in df.index:
-        if abs(df.loc[var, 'mean']) < threshold:
-            to_drop.add(var)
-    df = df.drop(index=to_drop, columns=to_drop)
-    df = df.drop(columns='mean')
-    return df
+# With backend='auto', matrices with more variables than this are drawn
+# as a single image instead of one scatter mark per cell
+IMAGE_BACKEND_MIN_VARS = 300
 
+# Longest side, in pixels, of the image drawn by the image backend
+IMAGE_MAX_PIXELS = 2048
 
-def superheat(
+# Most memory, in bytes, held by matrices kept by prepare_corr_cached()
+PREPARED_CACHE_BYTES = 64 * 1024**2
+_prepared_cache = OrderedDict()
+
+
+def sig_corr(corr:pd.DataFrame, threshold:float=None, top_k:int=None) -> pd.DataFrame:
+    """
+    Drop variables whose absolute mean correlation is below threshold,
+    and/or keep only the top_k variables with the strongest one.
+    """
+    strength = np.abs(corr.mean(axis=1).to_numpy())
+    keep = np.ones(len(strength), dtype=bool)
+    if threshold:
+        keep &= ~(strength < threshold)
+    if top_k and keep.sum() > top_k:
+        candidates = np.flatnonzero(keep)
+        ranked = np.nan_to_num(strength[candidates], nan=-np.inf)
+        strongest = candidates[np.argpartition(-ranked, top_k - 1)[:top_k]]
+        keep[:] = False
+        keep[strongest] = True
+    to_drop = corr.index[~keep]
+    return corr.drop(index=to_drop, columns=to_drop)
+
+
+@dataclass
+class PreparedCorr:
+    """
+    Melted, masked correlation matrix, ready to be plotted.
+    ---
+    Cells are ordered the same way pd.melt() would order them: by
+    column (sorted), then by row (original order). x and y are the
+    integer (int32) coordinates of each cell, and index into x_labels
+    and y_labels. When prepared with sparse=True, only nonzero cells are kept.
+    """
+    x: np.ndarray
+    y: np.ndarray
+    value: np.ndarray
+    x_labels: list
+    y_labels: list
+
+    @property
+    def nbytes(self) -> int:
+        return self.x.nbytes + self.y.nbytes + self.value.nbytes
+
+
+def prepare_corr(
         corr:pd.DataFrame,
-        title=None,
         thresh_avg=None,
         thresh_mask=None,
         half_mask=True,
         self_mask=True,
-        cbar=True,
-        mark_scale=5,
-        grid=True,
-        palette=None,
-        size=None,
-        title_fontsize=None,
-        marker='s',
-        bar_ticks=5,
-        n_colors=128,
-        **kwargs
-    ):
-
-    if not len(corr.columns) == len(corr.index):
-        raise ValueError("A correlation df needs the same length columns and index")
-
-    # Chart size
-    if size:
-        sns.set(rc={'figure.figsize':(size, size)})
-
-    # Data
-    dfc = corr.copy()
+        top_k=None,
+        top_pairs=None,
+        sparse=False,
+    ) -> PreparedCorr:
+    """
+    Data stage of superheat(), done entirely on numpy arrays.
+    ---
+    - top_k: keep only the k variables with the strongest absolute mean
+      correlation (see sig_corr)
+    - top_pairs: keep only the k strongest cells left after masking, and
+      only the variables they belong to. Implies sparse.
+    - sparse: return only nonzero cells, instead of the full melted matrix
+    """
     # Must fill null values with 0. Having any nulls in a df.corr() is
     # rare, and it's difficult for the user to fix the problem. This only
     # occurs when one of the input variables has the same numeric value for
@@ -52,41 +88,196 @@ def superheat(
     # dropna() on either axis would delete all the data. So our only option
     # is to remove the variable from the matrix by iteration (slow, but better)
     # or just filling nulls with 0.
-    dfc = dfc.fillna(0)
+    dfc = corr.fillna(0)
+
+    # Remove vars whose absolute mean corr is below threshold, or
+    # that aren't among the strongest
+    if thresh_avg or top_k:
+        dfc = sig_corr(dfc, thresh_avg, top_k)
+
+    # Columns are sorted, rows keep their original order
+    rows = list(dfc.index)
+    cols = sorted(dfc.columns)
+    values = dfc[cols].to_numpy(dtype=float, copy=True)
 
-    # Remove vars whose absolute mean corr is below threshold
-    if thresh_avg:
-        dfc = sig_corr(dfc, thresh_avg)
-    
     # Mask insignificant correlations, if requested
     if thresh_mask:
-        dfc = dfc.mask(abs(dfc) < thresh_mask).fillna(0)
-    
-    # Reindex before masking, since reindexing will happen later on if we don't
-    dfc = dfc.reindex(sorted(dfc.columns), axis=1)
+        values[np.abs(values) < thresh_mask] = 0
+
+    # Position of each row label among the (sorted) column labels
+    row_pos = pd.Index(cols).get_indexer(rows)
+    col_pos = np.arange(len(cols), dtype=np.int32)
     if half_mask:
-        for i, c in enumerate(dfc.columns):
-            # Remove duplicate correlations
-            for col in list(dfc.columns[0:i]):
-                dfc.loc[col, c] = 0
+        # Remove duplicate correlations
+        values[row_pos[:, None] < col_pos[None, :]] = 0
     if self_mask:
-        for i, c in enumerate(dfc.columns):
-            # Remove self-self correlations
-            dfc.loc[c,c] = 0.0
+        # Remove self-self correlations
+        values[row_pos[:, None] == col_pos[None, :]] = 0
 
-    num_vars = len(dfc.columns)
+    # Unpivot to get paired x & y arrays, in pd.melt() order
+    x_labels = sorted(set(rows))
+    y_labels = cols
+    x_to_num = {v: i for i, v in enumerate(x_labels)}
+    row_num = np.array([x_to_num[v] for v in rows], dtype=np.int32)
 
-    # Unpivot df to get paired x & y arrays
-    dfc = pd.melt(dfc.reset_index(), id_vars='index')
-    dfc.columns = ['x', 'y', 'value']
-    x = dfc['x']
-    y=dfc['y']
-    size=dfc['value'].abs()
+    if not (sparse or top_pairs):
+        return PreparedCorr(
+            x=np.tile(row_num, len(cols)),
+            y=np.repeat(col_pos, len(rows)),
+            value=values.T.ravel(),
+            x_labels=x_labels,
+            y_labels=y_labels,
+        )
+
+    # Nonzero cells only. Indexing the transpose keeps pd.melt() order
+    col, row = np.nonzero(values.T)
+    value = values[row, col]
+    x, y = row_num[row], col.astype(np.int32)
+
+    if top_pairs and len(value) > top_pairs:
+        strongest = np.argpartition(np.abs(value), len(value) - top_pairs)[len(value) - top_pairs:]
+        strongest.sort()
+        x, y, value = x[strongest], y[strongest], value[strongest]
+
+    if top_pairs:
+        # Only show variables that still have a cell. Both axes use the
+        # same variables, so the chart stays square.
+        used = np.union1d(x, y)
+        x_labels = [x_labels[i] for i in used]
+        y_labels = [y_labels[i] for i in used]
+        x, y = np.searchsorted(used, x).astype(np.int32), np.searchsorted(used, y).astype(np.int32)
+
+    return PreparedCorr(x=x, y=y, value=value, x_labels=x_labels, y_labels=y_labels)
+
+
+def corr_key(corr:pd.DataFrame) -> str:
+    """
+    Hash of a correlation df's values and labels
+    """
+    h = blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(corr.to_numpy(dtype=float)).data)
+    h.update(repr((list(corr.index), list(corr.columns))).encode())
+    return h.hexdigest()
+
+
+def prepare_corr_cached(corr:pd.DataFrame, *args, **kwargs) -> PreparedCorr:
+    """
+    Same as prepare_corr(), but remembers recent results, up to
+    PREPARED_CACHE_BYTES in total, so re-rendering the same matrix with
+    different cosmetic settings (title, palette, size...) skips the data
+    stage. Results bigger than that aren't kept.
+    ---
+    Returned arrays are shared between calls, and made read-only.
+    """
+    key = (corr_key(corr), args, tuple(sorted(kwargs.items())))
+    if key in _prepared_cache:
+        _prepared_cache.move_to_end(key)
+        return _prepared_cache[key]
+
+    data = prepare_corr(corr, *args, **kwargs)
+    for arr in (data.x, data.y, data.value):
+        arr.setflags(write=False)
+    if data.nbytes > PREPARED_CACHE_BYTES:
+        return data
+    _prepared_cache[key] = data
+    while sum(d.nbytes for d in _prepared_cache.values()) > PREPARED_CACHE_BYTES:
+        _prepared_cache.popitem(last=False)
+    return data
+
+
+def clear_prepared_cache():
+    _prepared_cache.clear()
+
+
+def value_to_index(values, n_colors, color_min=-1, color_max=1) -> np.ndarray:
+    """
+    Map an array of values onto positions in a palette of n_colors
+    """
+    # position of value in the input range, relative to the length of the input range
+    val_position = (np.asarray(values, dtype=float) - color_min) / (color_max - color_min)
+    return (val_position * (n_colors - 1)).astype(int) # target index in the color palette
+
+
+def value_to_color(values, palette, color_min=-1, color_max=1) -> np.ndarray:
+    """
+    Map an array of values onto a palette, returning an (n, 4) rgba array
+    """
+    colors = to_rgba_array(palette)
+    return colors[value_to_index(values, len(colors), color_min, color_max)]
+
+
+def draw_image(ax, data, x, y, value, colors, size_scale, max_pixels=IMAGE_MAX_PIXELS, **kwargs):
+    """
+    Draws size-scaled squares into one rgba image shown with imshow,
+    instead of drawing one scatter mark per cell. Each cell gets the same
+    number of pixels, chosen so the image stays within max_pixels.
+    """
+    nx, ny = len(data.x_labels), len(data.y_labels)
+    ppc = max(1, max_pixels // max(nx, ny)) # pixels per cell
+
+    # Scatter marks are sized by area, in points^2. Find the width of a
+    # mark relative to its cell, so the image matches the scatter version
+    fig = ax.get_figure()
+    pos = ax.get_position()
+    cell_w = pos.width * fig.get_figwidth() * 72 / nx
+    cell_h = pos.height * fig.get_figheight() * 72 / ny
+    side = np.sqrt(np.abs(value) * size_scale)
+    half_w = np.minimum(side / cell_w, 1) * ppc / 2
+    half_h = np.minimum(side / cell_h, 1) * ppc / 2
+
+    # Fraction of each pixel covered by the mark, along one axis. This
+    # anti-aliases marks that are only a few pixels wide.
+    offset = np.arange(ppc) - (ppc - 1) / 2
+    def coverage(half):
+        half = half[:, None]
+        return np.clip(np.minimum(half, offset + 0.5) - np.maximum(-half, offset - 0.5), 0, 1)
+
+    colors = np.round(colors * 255).astype(np.uint8)
+    image = np.zeros((ny, ppc, nx, ppc, 4), dtype=np.uint8)
+    image[y, :, x, :, :3] = colors[:, None, None, :3]
+    image[y, :, x, :, 3] = np.round(coverage(half_h)[:, :, None]
+                                    * coverage(half_w)[:, None, :]
+                                    * colors[:, None, None, 3])
+
+    return ax.imshow(
+        image.reshape(ny * ppc, nx * ppc, 4),
+        origin='lower',
+        extent=(-0.5, nx - 0.5, -0.5, ny - 0.5),
+        aspect='auto',
+        interpolation='nearest',
+        **kwargs,
+    )
+
+
+def resolve_palette(palette=None, n_colors=128) -> tuple:
+    """
+    Default palette if none given. Returns (palette, n_colors)
+    """
+    if palette is None:
+        return sns.diverging_palette(20, 220, n=n_colors), n_colors
+    return palette, len(palette)
+
+
+def draw_superheat(
+        ax,
+        data:PreparedCorr,
+        title=None,
+        mark_scale=5,
+        grid=True,
+        palette=None,
+        title_fontsize=None,
+        marker='s',
+        n_colors=128,
+        backend='auto',
+        **kwargs
+    ):
+    """
+    Draws prepared data onto an existing axes. Touches nothing but ax,
+    so it's safe to use on figures made without pyplot.
+    """
+    num_vars = len(data.y_labels)
+    size = np.abs(data.value)
 
-    # Plot setup
-    fig, ax = plt.subplots()
-    plot_grid = plt.GridSpec(1,30,hspace=0.2,wspace=0.1)
-    ax = plt.subplot(plot_grid[:,:-1])
     # Title font size
     if title_fontsize:
         title_fsize = title_fontsize
@@ -96,40 +287,45 @@ def superheat(
     ax.set_title(title, fontsize=title_fsize)
 
     # Color
-    if palette == None:
-        palette = sns.diverging_palette(20, 220, n=n_colors)
-    else:
-        n_colors = len(palette)
-    
+    palette, n_colors = resolve_palette(palette, n_colors)
     color_min, color_max = [-1, 1]
-    def value_to_color(val):
-        val_position = float((val - color_min)) / (color_max - color_min) # position of value in the input range, relative to the length of the input range
-        ind = int(val_position * (n_colors - 1)) # target index in the color palette
-        return palette[ind]
-    
+
     # Mapping from column names to integer coordinates
-    x_labels = [v for v in sorted(x.unique())]
-    y_labels = [v for v in sorted(y.unique())]
-    x_to_num = {p[1]:p[0] for p in enumerate(x_labels)} 
-    y_to_num = {p[1]:p[0] for p in enumerate(y_labels)} 
-    xmap = x.map(x_to_num)
-    ymap = y.map(y_to_num)
-    
+    x_labels = data.x_labels
+    y_labels = data.y_labels
+
     # Draw
     size_scale = mark_scale * 100
-    ax.scatter(
-        x=kwargs.pop('x', xmap),
-        y=kwargs.pop('y', ymap),
-        s=kwargs.pop('s', (size * size_scale)), # Vector of square sizes, proportional to size parameter
-        c=kwargs.pop('c', (dfc['value'].apply(value_to_color))),
-        marker=marker, # Use square as scatterplot marker
-        **kwargs,
-    )
-    
+    x, y, value = data.x, data.y, data.value
+
+    if backend == 'auto':
+        backend = 'image' if num_vars > IMAGE_BACKEND_MIN_VARS and not kwargs else 'scatter'
+
+    if backend == 'image':
+        colors = value_to_color(value, palette, color_min, color_max)
+        draw_image(ax, data, x, y, value, colors, size_scale, **kwargs)
+
+    elif backend == 'scatter':
+        if 'c' not in kwargs:
+            # Palette indices, looked up by matplotlib in one step at draw time
+            kwargs['c'] = value_to_index(value, n_colors, color_min, color_max)
+            kwargs.setdefault('cmap', ListedColormap(to_rgba_array(palette)))
+            kwargs.setdefault('norm', BoundaryNorm(np.arange(n_colors + 1) - 0.5, n_colors))
+        ax.scatter(
+            x=kwargs.pop('x', x),
+            y=kwargs.pop('y', y),
+            s=kwargs.pop('s', (size * size_scale)), # Vector of square sizes, proportional to size parameter
+            marker=marker, # Use square as scatterplot marker
+            **kwargs,
+        )
+
+    else:
+        raise ValueError(f"Unknown backend, '{backend}'. Use 'auto', 'scatter' or 'image'")
+
     # Show column labels on the axes
-    ax.set_xticks([x_to_num[v] for v in x_labels])
+    ax.set_xticks(range(len(x_labels)))
     ax.set_xticklabels(x_labels, rotation=45, horizontalalignment='right')
-    ax.set_yticks([y_to_num[v] for v in y_labels])
+    ax.set_yticks(range(len(y_labels)))
     ax.set_yticklabels(y_labels)
     ax.grid(False, 'major')
 
@@ -138,31 +334,129 @@ def superheat(
 
     ax.set_xticks([t + 0.5 for t in ax.get_xticks()], minor=True)
     ax.set_yticks([t + 0.5 for t in ax.get_yticks()], minor=True)
-    ax.set_xlim([-0.5, max([v for v in x_to_num.values()]) + 0.5])
-    ax.set_ylim([-0.5, max([v for v in y_to_num.values()]) + 0.5])
+    ax.set_xlim([-0.5, len(x_labels) - 1 + 0.5])
+    ax.set_ylim([-0.5, len(y_labels) - 1 + 0.5])
     ax.invert_xaxis()
 
+
+def draw_colorbar(axb, palette=None, n_colors=128, bar_ticks=5):
+    """
+    Draws the superheat color bar onto an existing axes
+    """
+    palette, n_colors = resolve_palette(palette, n_colors)
+    color_min, color_max = [-1, 1]
+
+    col_x = [1]*len(palette)
+    bar_y = np.linspace(color_min, color_max, n_colors)
+    
+    bar_height = bar_y[1] - bar_y[0]
+    axb.barh(
+        y=bar_y,
+        width=[2]*len(palette), # make bars 5 units wide
+        left=col_x, # Make bars start at 0
+        height=bar_height,
+        color=palette,
+        linewidth=0
+    )
+    axb.set_xlim(1, 2) # Bars are going from 0 to 5, so lets crop the plot somewhere in the middle
+    axb.grid(False) # Hide grid
+    axb.set_facecolor('white') # Make background white
+    axb.set_xticks([]) # Remove horizontal ticks
+    axb.set_yticks(np.linspace(min(bar_y), max(bar_y), bar_ticks)) # Show vertical ticks for min, middle and max
+    axb.yaxis.tick_right() # Show vertical ticks on the right
+
+
+def superheat(
+        corr:pd.DataFrame,
+        title=None,
+        thresh_avg=None,
+        thresh_mask=None,
+        half_mask=True,
+        self_mask=True,
+        cbar=True,
+        mark_scale=5,
+        grid=True,
+        palette=None,
+        size=None,
+        title_fontsize=None,
+        marker='s',
+        bar_ticks=5,
+        n_colors=128,
+        drop_zeros=True,
+        backend='auto',
+        top_k=None,
+        top_pairs=None,
+        cache=True,
+        **kwargs
+    ):
+
+    if not len(corr.columns) == len(corr.index):
+        raise ValueError("A correlation df needs the same length columns and index")
+
+    # Chart size
+    if size:
+        sns.set(rc={'figure.figsize':(size, size)})
+
+    data = prepare_superheat(
+            corr, thresh_avg, thresh_mask, half_mask, self_mask,
+            drop_zeros, top_k, top_pairs, cache, kwargs,
+            )
+
+    # Plot setup
+    fig, ax = plt.subplots()
+    plot_grid = plt.GridSpec(1,30,hspace=0.2,wspace=0.1)
+    ax = plt.subplot(plot_grid[:,:-1])
+
+    draw_superheat(
+            ax, data, title, mark_scale, grid, palette, title_fontsize,
+            marker, n_colors, backend, **kwargs,
+            )
+
     # Color Bar
     if cbar == True:
         axb = plt.subplot(plot_grid[:,-1])
-
-        col_x = [1]*len(palette)
-        bar_y = np.linspace(color_min, color_max, n_colors)
-        
-        bar_height = bar_y[1] - bar_y[0]
-        axb.barh(
-            y=bar_y,
-            width=[2]*len(palette), # make bars 5 units wide
-            left=col_x, # Make bars start at 0
-            height=bar_height,
-            color=palette,
-            linewidth=0
-        )
-        axb.set_xlim(1, 2) # Bars are going from 0 to 5, so lets crop the plot somewhere in the middle
-        axb.grid(False) # Hide grid
-        axb.set_facecolor('white') # Make background white
-        axb.set_xticks([]) # Remove horizontal ticks
-        axb.set_yticks(np.linspace(min(bar_y), max(bar_y), bar_ticks)) # Show vertical ticks for min, middle and max
-        axb.yaxis.tick_right() # Show vertical ticks on the right
+        draw_colorbar(axb, palette, n_colors, bar_ticks)
 
     return (fig, ax);
+
+
+def prepare_superheat(
+        corr:pd.DataFrame,
+        thresh_avg=None,
+        thresh_mask=None,
+        half_mask=True,
+        self_mask=True,
+        drop_zeros=True,
+        top_k=None,
+        top_pairs=None,
+        cache=True,
+        scatter_kwargs=None,
+    ) -> PreparedCorr:
+    """
+    Data stage of superheat(), given its arguments
+    """
+    # Masked cells have a size of 0, so unless x/y/s/c are given,
+    # drop them here, and matplotlib never has to draw them
+    sparse = drop_zeros and not {'x', 'y', 's', 'c'} & (scatter_kwargs or {}).keys()
+    prepare = prepare_corr_cached if cache else prepare_corr
+    return prepare(
+            corr, thresh_avg, thresh_mask, half_mask, self_mask,
+            top_k=top_k, top_pairs=top_pairs, sparse=sparse,
+            )
+
+
+def superheat_from_data(
+        df:pd.DataFrame,
+        method='pearson',
+        chunksize=100_000,
+        dtype=np.float64,
+        n_jobs=None,
+        **kwargs
+    ):
+    """
+    Same as superheat(), but takes raw data instead of a correlation df.
+    Correlations are computed from chunks of rows (see corr_chunked),
+    so the data never needs a full float64 copy.
+    """
+    corr = corr_chunked(df, method=method, chunksize=chunksize, dtype=dtype, n_jobs=n_jobs)
+    return superheat(corr, **kwargs)